@@ -1,151 +1,691 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 # Ensure this line correctly imports the Item class from the new models.py
-from models import Item 
+from models import ITEM_TYPES, encode_json, is_int64
+from catalog import open_catalog
+from indexes import SORT_FIELDS, FACETS
+from cache import LRUCache
+import metrics
 import os
+import atexit
+import signal
+import sys
+import threading
+import base64
+import csv
+import io
 import json
-import operator 
+import time
 
 # --- FILE PERSISTENCE CONFIGURATION (MANDATORY CHANGE) ---
 BASE_DIR = os.path.dirname(__file__)
 DATA_FILE_PATH = os.path.join(BASE_DIR, 'library_data.json')
+SQLITE_PATH = os.path.join(BASE_DIR, 'items.db')
+# 'json': whole catalog in memory, persisted to library_data.json plus a log.
+# 'sqlite': catalog served from items.db without loading it into memory.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json').strip().lower()
+# JSON backend snapshot: 'json' (library_data.json) or 'binary' (library_data.bin,
+# several times faster to load). Either is read at startup, whichever exists.
+SNAPSHOT_FORMAT = os.environ.get('SNAPSHOT_FORMAT', 'json').strip().lower()
+# JSON backend writes: 'sync' (each write fsynced before it is acknowledged),
+# 'flush' (writes buffered and written together every FLUSH_INTERVAL_MS, each
+# acknowledged once its batch is on disk) or 'immediate' (acknowledged at once;
+# a crash can lose the last FLUSH_INTERVAL_MS of writes).
+DURABILITY = os.environ.get('DURABILITY', 'sync').strip().lower()
+FLUSH_INTERVAL_MS = float(os.environ.get('FLUSH_INTERVAL_MS', '10') or 10)
 # --- END PERSISTENCE CONFIGURATION ---
 
+# Requests slower than this many milliseconds are sampled and their hottest
+# stacks printed; 0 (the default) leaves the profiler off.
+PROFILE_SLOW_REQUESTS_MS = float(os.environ.get('PROFILE_SLOW_REQUESTS_MS', '0') or 0)
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag', 'X-Query-Plan'])
+
+# Reads are served while the JSON backend's indexes are still being built.
+catalog = open_catalog(STORAGE_BACKEND, DATA_FILE_PATH, SQLITE_PATH,
+                       snapshot_format=SNAPSHOT_FORMAT, background_indexing=True,
+                       durability=DURABILITY, flush_interval=FLUSH_INTERVAL_MS / 1000)
+# Writes buffered by DURABILITY='flush'/'immediate' are flushed here on exit.
+atexit.register(catalog.close)
+
+# Streamed responses are produced this many items at a time, each chunk
+# resuming from the previous one's sort key.
+STREAM_CHUNK_SIZE = 500
+
+# Larger ?limit= values are cut to this; leave limit out (or stream) for every item.
+MAX_LIMIT = 10000
+
+# Facet counts report at most this many authors (the most common) unless
+# ?facet_limit= asks for another number.
+FACET_LIMIT = 20
+
+# mode=fuzzy returns the `limit` (default FUZZY_LIMIT, at most FUZZY_MAX_LIMIT)
+# best matches for `q`, ranked by relevance instead of sorted.
+FUZZY_LIMIT = 20
+FUZZY_MAX_LIMIT = 200
+
+# Encoded GET /items pages, keyed on the ETag (catalog version) and the query: a write
+# bumps the version, so older entries are never served again and simply age out.
+RESPONSE_CACHE_ENTRIES = 256
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+response_cache = LRUCache(RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_BYTES)
+
+# --- Metrics ---
+
+REQUEST_SECONDS = metrics.Histogram(
+    'library_request_seconds', 'Time to produce a response, by endpoint.', ('endpoint',))
+REQUESTS = metrics.Counter(
+    'library_requests_total', 'Requests served, by endpoint and status code.', ('endpoint', 'status'))
+metrics.Callback('library_response_cache_hits_total', 'GET /items pages served from the response cache.',
+                 'counter', lambda: response_cache.hits)
+metrics.Callback('library_response_cache_misses_total', 'GET /items pages that had to be built.',
+                 'counter', lambda: response_cache.misses)
+metrics.Callback('library_response_cache_entries', 'Pages currently in the response cache.',
+                 'gauge', lambda: len(response_cache))
+
+profiler = metrics.SlowRequestProfiler(PROFILE_SLOW_REQUESTS_MS / 1000) if PROFILE_SLOW_REQUESTS_MS > 0 else None
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler:
+        profiler.start(f"{request.method} {request.full_path}")
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    REQUESTS.labels(endpoint, response.status_code).inc()
+    return response
 
-media_items = []
-next_item_id = 1
+
+@app.teardown_request
+def finish_request_profile(exc):
+    if profiler:
+        profiler.finish()
+
+
+_loaded = False
+_load_lock = threading.Lock()
 
 
 def load_data():
-    """Loads media data from the JSON file into memory at startup."""
-    global media_items, next_item_id
-    media_items = []
-    
-    # Check 1: If the file does not exist, create it with samples
-    if not os.path.exists(DATA_FILE_PATH):
-        print(f"Creating initial data file: {DATA_FILE_PATH}")
-        # FIX: Ensure all sample creation uses 'id=' and not 'item_id='
-        samples = [
-            Item(id=1, type='book', title='The Pragmatic Engineer', author='John Doe', year=2020),
-            Item(id=2, type='magazine', title='Science Monthly', author='Editorial Team', year=2024),
-            Item(id=3, type='film', title='Space Adventure', author='Jane Director', year=2019),
-            Item(id=4, type='book', title='A Brief History of Time', author='Stephen Hawking', year=1988),
-            Item(id=5, type='book', title='Zen and the Art of Motorcycle Maintenance', author='Robert Pirsig', year=1974),
-        ]
-        media_items = samples
-        save_data()
-        next_item_id = len(media_items) + 1
-        return
+    """Loads (or, for SQLite, opens and prepares) the catalog at startup."""
+    global _loaded
+    catalog.load()
+    _loaded = True
 
-    try:
-        # Check 2: Load data from the existing file
-        with open(DATA_FILE_PATH, 'r') as f:
-            data = json.load(f)
-            
-        for item_data in data:
-            media_items.append(Item(
-                id=item_data.get('id'), # FIX: Ensure constructor call uses 'id'
-                type=item_data.get('type'), 
-                title=item_data.get('title'), 
-                author=item_data.get('author'), 
-                year=item_data.get('year')
-            ))
-            
-        if media_items:
-            next_item_id = max(item.id for item in media_items) + 1
-        else:
-            next_item_id = 1
-            
-    except Exception as e:
-        print(f"Error loading JSON data: {e}. Starting with empty data.")
-        media_items = []
-        next_item_id = 1
+
+@app.before_request
+def ensure_loaded():
+    """
+    Loads the catalog on the first request when the app is served by a WSGI
+    server (e.g. `gunicorn -w 4 backend:app`) instead of `python backend.py`.
+    Each worker process loads its own copy; the JSON backend keeps the copies
+    in step through the shared log, the SQLite backend through items.db.
+    """
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                load_data()
         
 
 def save_data():
-    """Writes the current data list back to the JSON file for persistence."""
-    try:
-        data_to_save = [item.as_dict() for item in media_items]
-        with open(DATA_FILE_PATH, 'w') as f:
-            json.dump(data_to_save, f, indent=4) 
-    except Exception as e:
-        print(f"CRITICAL ERROR: Failed to save JSON data: {e}") 
+    """Writes a full checkpoint of the catalog."""
+    catalog.save()
 
 
 # --------------------------------------------------------------------------------
 # API ROUTES 
 # --------------------------------------------------------------------------------
 
+def encode_cursor(sort, order, key):
+    """Packs the sort key of the last item on a page into an opaque token."""
+    raw = json.dumps([sort, order, list(key)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, sort, order):
+    """Returns the sort key stored in `cursor`, or raises ValueError if it does not fit this query."""
+    try:
+        cursor_sort, cursor_order, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('malformed cursor')
+    if cursor_sort != sort or cursor_order != order or not isinstance(key, list):
+        raise ValueError('cursor does not match sort/order')
+    return tuple(key)
+
+
+def parse_item_filters():
+    """
+    Reads the item filters shared by GET /items and GET /items/facets: `q`,
+    `type` (repeated or comma-separated; unknown types are ignored), `author`
+    (exact match) and `year_min`/`year_max` (inclusive). Returns (keyword
+    arguments for catalog.query()/facets(), None) or (None, error message).
+    """
+    types = sorted({
+        t.strip() for value in request.args.getlist('type') for t in value.lower().split(',')
+        if t.strip() in ITEM_TYPES
+    })
+    filters = {
+        'q': request.args.get('q', '').strip().lower(),
+        'type_filter': types[0] if len(types) == 1 else tuple(types) or None,
+        'author': request.args.get('author', '').strip() or None,
+    }
+    for name in ('year_min', 'year_max'):
+        value = request.args.get(name, '').strip()
+        try:
+            filters[name] = int(value) if value else None
+        except ValueError:
+            return None, f'invalid {name}'
+        if value and not is_int64(filters[name]):
+            return None, f'invalid {name}'
+    return filters, None
+
+
+def parse_facets(value):
+    """Returns the facet names in a comma-separated `facets` argument; raises ValueError for unknown ones."""
+    names = tuple(dict.fromkeys(name.strip() for name in value.lower().split(',') if name.strip()))
+    if any(name not in FACETS for name in names):
+        raise ValueError('unknown facet')
+    return names
+
+
+def facets_as_dict(counts, names, limit):
+    """
+    Shapes catalog.facets() counts for JSON: per requested facet a list of
+    {'value', 'count'}, years in order (no year first) and types and authors
+    most common first, authors cut to `limit`; plus the number of items counted.
+    """
+    result = {'total': sum(counts['type'].values())}
+    for name in names:
+        values = counts[name]
+        if name == 'year':
+            ordered = sorted(values.items(), key=lambda pair: (pair[0] is not None, pair[0] or 0))
+        else:
+            ordered = sorted(values.items(), key=lambda pair: (-pair[1], str(pair[0])))
+            if name == 'author':
+                ordered = ordered[:limit]
+        result[name] = [{'value': value, 'count': count} for value, count in ordered]
+    return result
+
+
+def catalog_etag(version):
+    """The ETag of responses built at catalog `version`; epochs tell apart versions that were reused."""
+    return f'{catalog.epoch:x}-{version}'
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def page_response(body, next_cursor, etag):
+    """A JSON response from already-encoded bytes, tagged with the catalog version."""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Clients may keep the page but must revalidate it (cheap: usually a 304).
+    response.headers['Cache-Control'] = 'no-cache'
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Counters and timings in the Prometheus text format. library_phase_seconds
+    breaks list_items/create_item/delete_item and the catalog's load, save,
+    create, update and delete down by phase. Every worker process reports
+    only its own figures.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/items', methods=['GET'])
 def list_items():
-    q = request.args.get('q', '').strip().lower()
-    t = request.args.get('type', '').strip().lower()
+    timer = metrics.PhaseTimer('list_items')
+    filters, error = parse_item_filters()
+    sort = request.args.get('sort', 'title').strip().lower()
+    order = request.args.get('order', 'asc').strip().lower()
+    limit = request.args.get('limit', '').strip()
+    cursor = request.args.get('cursor', '').strip()
+    stream = request.args.get('stream', '').strip().lower()
+    facets = request.args.get('facets', '')
+    facet_limit = request.args.get('facet_limit', str(FACET_LIMIT)).strip()
+    # debug=1 reports how the catalog answered in an X-Query-Plan header.
+    debug = request.args.get('debug', '').strip().lower() in ('1', 'true')
+    mode = request.args.get('mode', '').strip().lower()
     
-    filtered_items = media_items
+    if error:
+        return jsonify({'error': error}), 400
+    if sort not in SORT_FIELDS:
+        return jsonify({'error': 'invalid sort'}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': 'invalid order'}), 400
+    if stream not in ('', 'json', 'ndjson'):
+        return jsonify({'error': 'invalid stream'}), 400
+    if mode not in ('', 'substring', 'fuzzy'):
+        return jsonify({'error': 'invalid mode'}), 400
+    if limit:
+        if not limit.isdigit() or int(limit) < 1:
+            return jsonify({'error': 'invalid limit'}), 400
+        limit = min(int(limit), MAX_LIMIT)
+    else:
+        limit = None
+    try:
+        after = decode_cursor(cursor, sort, order) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'invalid cursor'}), 400
+    try:
+        facets = parse_facets(facets)
+    except ValueError:
+        return jsonify({'error': 'invalid facets'}), 400
+    if facets and stream:
+        return jsonify({'error': 'facets cannot be combined with stream'}), 400
+    if not facet_limit.isdigit():
+        return jsonify({'error': 'invalid facet_limit'}), 400
+    facet_limit = int(facet_limit)
+    # Without words to rank by, a fuzzy search is a plain listing.
+    fuzzy = mode == 'fuzzy' and bool(filters['q'])
+    if fuzzy and (stream or cursor or facets):
+        return jsonify({'error': 'mode=fuzzy cannot be combined with stream, cursor or facets'}), 400
+    descending = order == 'desc'
+    timer.mark('parse')
     
-    if t in ('book', 'magazine', 'film'):
-        filtered_items = [item for item in filtered_items if item.type == t]
-        
-    if q:
-        filtered_items = [
-            item for item in filtered_items 
-            if q in item.title.lower() or q in item.author.lower()
-        ]
+    # Read before the items, so a page is never tagged newer than its contents.
+    version = catalog.version
+    etag = catalog_etag(version)
+    cache_key = (etag, *filters.values(), fuzzy, sort, order, limit, cursor, facets, facet_limit if facets else None)
+    if not stream and not debug:
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        cached = response_cache.get(cache_key)
+        timer.mark('cache')
+        if cached is not None:
+            return page_response(*cached, etag)
     
-    filtered_items.sort(key=operator.attrgetter('title'))
+    if fuzzy:
+        ranked = catalog.fuzzy_search(limit=min(limit or FUZZY_LIMIT, FUZZY_MAX_LIMIT), **filters)
+        timer.mark('fuzzy')
+        body = b'[' + b','.join(item.to_json() for item in ranked) + b']'
+        if not debug:
+            response_cache.put(cache_key, (body, None), len(body))
+        timer.mark('encode')
+        return page_response(body, None, etag)
     
-    items_as_dict = [i.as_dict() for i in filtered_items]
+    query = catalog.query(sort=sort, descending=descending, **filters)
+    timer.mark('query')
+    
+    try:
+        first = query.fetch(after, STREAM_CHUNK_SIZE if stream else limit and limit + 1)
+    except (TypeError, ValueError):
+        if after is None:
+            raise
+        # The cursor's key does not fit this field's keys
+        return jsonify({'error': 'invalid cursor'}), 400
+    timer.mark('fetch')
     
-    return jsonify(items_as_dict)
+    if stream:
+        response = Response(stream_items(first, query, limit, stream), mimetype=(
+            'application/x-ndjson' if stream == 'ndjson' else 'application/json'))
+        if debug:
+            response.headers['X-Query-Plan'] = query.explain()
+        return response
+    
+    next_cursor = None
+    if limit is not None and len(first) > limit:
+        first = first[:limit]
+        next_cursor = encode_cursor(sort, order, query.key(first[-1]))
+    
+    # Joined from each item's cached encoding rather than re-encoding every item.
+    body = b'[' + b','.join(item.to_json() for item in first) + b']'
+    if facets:
+        # Counts for everything matching the filters, not just this page.
+        counts = facets_as_dict(catalog.facets(**filters), facets, facet_limit)
+        body = b'{"items":' + body + b',"facets":' + encode_json(counts) + b'}'
+    timer.mark('encode')
+    if debug:
+        response = page_response(body, next_cursor, etag)
+        response.headers['X-Query-Plan'] = query.explain()
+        return response
+    response_cache.put(cache_key, (body, next_cursor), len(body))
+    return page_response(body, next_cursor, etag)
 
 
-@app.route('/items', methods=['POST'])
-def create_item():
-    global next_item_id
-    data = request.get_json() or {}
+@app.route('/items/facets', methods=['GET'])
+def list_facets():
+    """
+    Item counts by type, year (per decade) and author for the items matching
+    the GET /items filters, or the whole catalog. `facets` picks which to
+    report (default: all), `facet_limit` how many authors.
+    """
+    filters, error = parse_item_filters()
+    if error:
+        return jsonify({'error': error}), 400
+    facet_limit = request.args.get('facet_limit', str(FACET_LIMIT)).strip()
+    try:
+        facets = parse_facets(request.args.get('facets', '')) or FACETS
+    except ValueError:
+        return jsonify({'error': 'invalid facets'}), 400
+    if not facet_limit.isdigit():
+        return jsonify({'error': 'invalid facet_limit'}), 400
+    
+    etag = catalog_etag(catalog.version)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    counts = facets_as_dict(catalog.facets(**filters), facets, int(facet_limit))
+    return page_response(encode_json(counts), None, etag)
+
+
+def iter_chunks(chunk, query, limit=None):
+    """Yields `chunk`, then each following chunk resumed from the sort key where the last one ended."""
+    remaining = limit
+    while chunk:
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        yield chunk
+        if remaining == 0:
+            return
+        chunk = query.fetch(query.key(chunk[-1]), STREAM_CHUNK_SIZE)
+
+
+def stream_items(chunk, query, limit, fmt):
+    """Yields a JSON array or NDJSON body chunk by chunk instead of building it whole."""
+    sent = False
+    if fmt == 'json':
+        yield b'['
+    for chunk in iter_chunks(chunk, query, limit):
+        if fmt == 'ndjson':
+            yield b''.join(item.to_json() + b'\n' for item in chunk)
+        else:
+            yield (b',' if sent else b'') + b','.join(item.to_json() for item in chunk)
+            sent = True
+    if fmt == 'json':
+        yield b']'
+
+
+def validate_item_fields(data, partial=False):
+    """
+    Checks and normalizes the item fields of a request body. Returns (fields, None)
+    or (None, error message). With partial=True only the fields present are checked.
+    """
+    if not isinstance(data, dict):
+        return None, 'expected a JSON object'
     type_ = data.get('type')
     title = data.get('title')
-    author = data.get('author')
-    year = data.get('year')
     
-    if not type_ or not title:
-        return jsonify({'error': 'type and title are required'}), 400
-    if type_.lower() not in ('book', 'magazine', 'film'):
-        return jsonify({'error': 'invalid type'}), 400
+    if not partial and (not type_ or not title):
+        return None, 'type and title are required'
+    
+    fields = {}
+    if 'type' in data:
+        if not isinstance(type_, str) or type_.lower() not in ITEM_TYPES:
+            return None, 'invalid type'
+        fields['type'] = type_.lower()
+    if 'title' in data:
+        if not isinstance(title, str) or not title.strip():
+            return None, 'title must not be empty'
+        fields['title'] = title.strip()
+    if 'author' in data or not partial:
+        author = data.get('author')
+        if author is not None and not isinstance(author, str):
+            return None, 'invalid author'
+        fields['author'] = (author or '').strip()
+    if 'year' in data or not partial:
+        year = data.get('year')
+        if year is not None and not is_int64(year):
+            return None, 'invalid year'
+        fields['year'] = year
+    return fields, None
+
+
+@app.route('/items', methods=['POST'])
+def create_item():
+    timer = metrics.PhaseTimer('create_item')
+    data = request.get_json() or {}
+    fields, error = validate_item_fields(data)
+    if error:
+        return jsonify({'error': error}), 400
+    timer.mark('validate')
         
-    new_item = Item(
-        id=next_item_id, # FIX: Ensure constructor call uses 'id'
-        type=type_.lower(), 
-        title=title.strip(), 
-        author=(author or '').strip(), 
-        year=year
-    )
+    new_item = catalog.create(fields)
+    timer.mark('store')
     
-    media_items.append(new_item)
-    next_item_id += 1 
+    response = jsonify(new_item.as_dict()), 201
+    timer.mark('encode')
+    return response
+
+
+@app.route('/items/bulk', methods=['POST'])
+def bulk_create_items():
+    """
+    Creates many items from a JSON array or an NDJSON body (one object per line).
+    Every row is validated like POST /items; valid rows are all applied together
+    and persisted in one write, invalid rows are reported by index.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = parse_ndjson_rows(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({'error': 'expected a JSON array or NDJSON body'}), 400
+        rows = ((row, None) for row in data)
     
-    save_data() 
+    results = []
+    valid = []
+    for row_number, (data, error) in enumerate(rows):
+        fields = None
+        if error is None:
+            fields, error = validate_item_fields(data)
+        if error:
+            results.append({'row': row_number, 'error': error})
+        else:
+            valid.append((row_number, fields))
     
-    return jsonify(new_item.as_dict()), 201
+    created = catalog.create_many([fields for _, fields in valid]) if valid else []
+    for (row_number, _), new_item in zip(valid, created):
+        results.append({'row': row_number, 'id': new_item.id})
+    
+    results.sort(key=lambda result: result['row'])
+    return jsonify({
+        'created': len(created),
+        'failed': len(results) - len(created),
+        'results': results,
+    }), 201 if created else 200
 
 
-@app.route('/items/<int:item_id>', methods=['DELETE'])
-def delete_item(item_id):
-    global media_items
+def parse_ndjson_rows(stream):
+    """Yields (object, None) per NDJSON line, or (None, error) for lines that are not JSON."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError:
+            yield None, 'invalid JSON'
+
+
+@app.route('/items/export', methods=['GET'])
+def export_items():
+    """Streams the whole catalog, in id order, as NDJSON (default) or CSV."""
+    fmt = request.args.get('format', 'ndjson').strip().lower()
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'invalid format'}), 400
+    
+    query = catalog.query(sort='id')
+    chunks = iter_chunks(query.fetch(None, STREAM_CHUNK_SIZE), query)
+    
+    if fmt == 'csv':
+        body = export_csv(chunks)
+        response = Response(body, mimetype='text/csv')
+        response.headers['Content-Disposition'] = 'attachment; filename=items.csv'
+        return response
+    body = (b''.join(item.to_json() + b'\n' for item in chunk) for chunk in chunks)
+    return Response(body, mimetype='application/x-ndjson')
+
+
+def export_csv(chunks):
+    fieldnames = ['id', 'type', 'title', 'author', 'year']
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    for chunk in chunks:
+        writer.writerows(item.as_dict() for item in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# --- Change feed ---
+
+# Longest a GET /items/changes long-poll may wait (?wait=<seconds>).
+CHANGE_WAIT_MAX = 60
+# Most changes returned (or sent between waits) at once.
+CHANGE_BATCH_SIZE = 1000
+# Waiters re-check this often, which is how they notice other worker processes' writes.
+CHANGE_POLL_INTERVAL = 1.0
+# Idle SSE streams send a comment this often so proxies keep them open.
+SSE_HEARTBEAT = 15
+
+_changes_cond = threading.Condition()
+_write_count = 0
+
+
+@app.after_request
+def notify_change_waiters(response):
+    """Wakes long-polls and SSE streams after any request that may have changed the catalog."""
+    global _write_count
+    if request.method in ('POST', 'PATCH', 'DELETE'):
+        with _changes_cond:
+            _write_count += 1
+            _changes_cond.notify_all()
+    return response
+
+
+def change_as_dict(seq, op, value):
+    if op == 'delete':
+        return {'seq': seq, 'op': op, 'id': value}
+    return {'seq': seq, 'op': op, 'item': value.as_dict()}
+
+
+def wait_for_changes(since, timeout):
+    """Returns catalog.changes(since), waiting up to `timeout` seconds while there are none."""
+    deadline = time.monotonic() + timeout
+    while True:
+        with _changes_cond:
+            writes = _write_count
+        changes = catalog.changes(since, CHANGE_BATCH_SIZE)
+        remaining = deadline - time.monotonic()
+        if changes is None or changes or remaining <= 0:
+            return changes
+        with _changes_cond:
+            # Skip the wait if a write finished since the check above.
+            if _write_count == writes:
+                _changes_cond.wait(min(remaining, CHANGE_POLL_INTERVAL))
+
+
+@app.route('/items/changes', methods=['GET'])
+def list_changes():
+    """
+    The change feed: creates, updates and deletes numbered by the catalog version
+    they produced. Returns the changes after `since` (default: now), waiting up
+    to `wait` seconds while there are none, with `seq` to pass as the next
+    `since`. Answers 410 when they are no longer kept and the client must reload
+    the list. stream=sse sends them as Server-Sent Events instead.
+    """
+    since = request.args.get('since', '').strip() or request.headers.get('Last-Event-ID', '').strip()
+    wait = request.args.get('wait', '0').strip()
+    stream = request.args.get('stream', '').strip().lower()
+    
+    if since and not since.isdigit():
+        return jsonify({'error': 'invalid since'}), 400
+    if not wait.isdigit():
+        return jsonify({'error': 'invalid wait'}), 400
+    if stream not in ('', 'sse'):
+        return jsonify({'error': 'invalid stream'}), 400
+    since = int(since) if since else catalog.version
     
-    initial_count = len(media_items)
-    media_items = [item for item in media_items if item.id != item_id]
+    if stream:
+        response = Response(stream_changes(since), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
-    if len(media_items) == initial_count:
+    changes = wait_for_changes(since, min(int(wait), CHANGE_WAIT_MAX))
+    if changes is None:
+        return jsonify({'error': 'changes are no longer available; reload the items', 'seq': catalog.version}), 410
+    return jsonify({
+        'seq': changes[-1][0] if changes else since,
+        'changes': [change_as_dict(*change) for change in changes],
+    })
+
+
+def stream_changes(since):
+    """Yields the change feed as Server-Sent Events, with `seq` as each event's id, until the client leaves."""
+    while True:
+        changes = wait_for_changes(since, SSE_HEARTBEAT)
+        if changes is None:
+            # Too far behind: the client must reload, then carry on from here.
+            since = catalog.version
+            yield f'id: {since}\nevent: reset\ndata: {{"seq":{since}}}\n\n'.encode()
+        elif changes:
+            yield b''.join(f'id: {seq}\nevent: {op}\ndata: '.encode() + encode_json(change_as_dict(seq, op, value)) + b'\n\n'
+                           for seq, op, value in changes)
+            since = changes[-1][0]
+        else:
+            yield b': keepalive\n\n'
+
+
+@app.route('/items/<int:item_id>', methods=['GET'])
+def get_item(item_id):
+    etag = catalog_etag(catalog.version)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    item = catalog.get(item_id)
+    if item is None:
         return jsonify({'error': 'not found'}), 404
-        
-    save_data() 
+    response = jsonify(item.as_dict())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/items/<int:item_id>', methods=['PATCH'])
+def update_item(item_id):
+    if catalog.get(item_id) is None:
+        return jsonify({'error': 'not found'}), 404
+    data = request.get_json() or {}
+    fields, error = validate_item_fields(data, partial=True)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    updated = catalog.update(item_id, fields)
+    if updated is None:
+        return jsonify({'error': 'not found'}), 404
+    
+    return jsonify(updated.as_dict())
+
+
+@app.route('/items/<int:item_id>', methods=['DELETE'])
+def delete_item(item_id):
+    timer = metrics.PhaseTimer('delete_item')
+    if not catalog.delete(item_id):
+        return jsonify({'error': 'not found'}), 404
+    timer.mark('store')
     
     return jsonify({'ok': True})
 
 
 if __name__ == '__main__':
+    # Exit normally on SIGTERM, so atexit handlers (catalog.close) still run.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     load_data() 
     app.run(debug=True, port=5000)
\ No newline at end of file
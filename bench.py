@@ -0,0 +1,722 @@
+# bench.py - benchmarks for the media catalog backend
+#
+#   python bench.py memory --sizes 100000 1000000
+#   python bench.py stress --threads 16 --ops 500 --storage json
+#   python bench.py listing --sizes 10000 100000
+#   python bench.py load --sizes 100000 1000000
+#   python bench.py generate --count 100000 --output library_data.json
+#   python bench.py loadgen --size 100000 --requests 5000 --threads 8 --target server
+#   python bench.py suite --sizes 1000 10000 100000 --output results.json
+#   python bench.py compare baseline.json results.json
+#
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import models
+from models import Item, ITEM_TYPES
+from indexes import count_facets
+from storage import DURABILITY_MODES, write_snapshot, read_snapshot, binary_snapshot_path
+
+TYPES = ('book', 'magazine', 'film')
+WORDS = ('time', 'space', 'history', 'art', 'engineer', 'science', 'monthly', 'zen',
+         'adventure', 'brief', 'motorcycle', 'maintenance', 'pragmatic', 'night', 'river',
+         'empire', 'garden', 'machine', 'winter', 'signal', 'atlas', 'harbor', 'code')
+
+
+def iter_catalog(count, seed=0, authors=5000):
+    """
+    Yields `count` synthetic item dicts in the library_data.json schema. Every
+    string is a fresh object, as if just parsed from JSON.
+    """
+    rng = random.Random(seed)
+    author_names = [(rng.choice(WORDS).title(), rng.choice(WORDS).title()) for _ in range(authors)]
+    for item_id in range(1, count + 1):
+        first, last = author_names[rng.randrange(authors)]
+        yield {
+            'id': item_id,
+            'type': rng.choice(TYPES).lower(),
+            'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).title() + f" {item_id}",
+            'author': f"{first} {last}son",
+            'year': rng.randint(1900, 2025),
+        }
+
+
+def make_catalog(count, seed=0):
+    """Returns `count` synthetic item dicts in the library_data.json schema."""
+    return list(iter_catalog(count, seed))
+
+
+class DictItem:
+    """The pre-__slots__ Item: a plain class with a per-instance __dict__ and no interning."""
+    def __init__(self, id, type, title, author, year):
+        self.id = id
+        self.type = type
+        self.title = title
+        self.author = author
+        self.year = year
+
+
+def rss_kb():
+    """Current resident set size of this process, in KiB (Linux)."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+# --------------------------------------------------------------------------------
+# MEMORY
+# --------------------------------------------------------------------------------
+
+def measure_items(item_class, count):
+    """Builds `count` items record by record, as load_data() does, and reports the RSS growth."""
+    before = rss_kb()
+    items = [item_class(id=d['id'], type=d['type'], title=d['title'], author=d['author'], year=d['year'])
+             for d in iter_catalog(count)]
+    return {'items': len(items), 'rss_kb': rss_kb() - before}
+
+
+def run_memory(sizes):
+    results = []
+    for count in sizes:
+        for name in ('dict', 'slots'):
+            # A fresh interpreter per measurement keeps allocator state independent.
+            out = subprocess.run(
+                [sys.executable, __file__, '_measure', name, str(count)],
+                check=True, capture_output=True, text=True).stdout
+            result = json.loads(out)
+            result.update(model=name)
+            results.append(result)
+            print(f"{name:>6} x {count:>9,}: {result['rss_kb'] / 1024:8.1f} MiB "
+                  f"({result['rss_kb'] * 1024 / count:6.1f} bytes/item)", file=sys.stderr)
+    return results
+
+
+# --------------------------------------------------------------------------------
+# STRESS
+# --------------------------------------------------------------------------------
+
+def use_catalog(storage, directory, durability='sync'):
+    """Points backend.py at a fresh catalog stored under `directory`; returns the backend module."""
+    import backend
+    from catalog import open_catalog
+    backend.catalog.close()
+    backend.catalog = open_catalog(storage, os.path.join(directory, 'library_data.json'),
+                                   os.path.join(directory, 'items.db'), durability=durability)
+    backend.catalog.load()
+    backend._loaded = True
+    # Pages cached from the previous catalog can never be served again.
+    backend.response_cache.clear()
+    return backend
+
+
+def check_json_indexes(catalog):
+    """Returns a list of inconsistencies between a JsonCatalog's items and its indexes."""
+    problems = []
+    items = list(catalog.items.values())
+    for (type_, field), index in catalog.sorted_indexes.items():
+        expected = sorted((i for i in items if type_ is None or i.type == type_), key=index.key)
+        if [i.id for i in index] != [i.id for i in expected]:
+            problems.append(f"sorted index {(type_, field)} disagrees with the items")
+    if len(catalog.search_index) != len(items):
+        problems.append(f"search index has {len(catalog.search_index)} items, catalog has {len(items)}")
+    for item in items[:200]:
+        if item.id not in {i.id for i in catalog.search_index.search(item.title.lower())}:
+            problems.append(f"search index cannot find item {item.id}")
+    return problems
+
+
+def run_stress(threads, ops, storage, durability='sync'):
+    """
+    Hammers create/bulk/patch/delete/list from many threads at once, then checks
+    that every id was handed out once, that the API, the indexes and the data
+    reloaded from disk all agree, and that every listed page was correctly ordered.
+    With a write-behind `durability`, the reload also checks that close() flushed.
+    """
+    failures = []
+    created = []
+    deleted = []
+    record = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = backend.app.test_client()
+        own = []
+        for _ in range(ops):
+            roll = rng.random()
+            if roll < 0.3:
+                res = client.post('/items', json=next(catalog_rows))
+                own.append(res.get_json()['id'])
+            elif roll < 0.35:
+                res = client.post('/items/bulk', json=[next(catalog_rows) for _ in range(5)])
+                own.extend(r['id'] for r in res.get_json()['results'])
+            elif roll < 0.45 and own:
+                item_id = own.pop(rng.randrange(len(own)))
+                if client.delete(f'/items/{item_id}').status_code != 200:
+                    failures.append(f"delete of live item {item_id} failed")
+                with record:
+                    deleted.append(item_id)
+            elif roll < 0.5 and own:
+                item_id = rng.choice(own)
+                if client.patch(f'/items/{item_id}', json={'year': rng.randint(1900, 2025)}).status_code != 200:
+                    failures.append(f"patch of live item {item_id} failed")
+            else:
+                sort = rng.choice(('title', 'year', 'id'))
+                res = client.get('/items', query_string={
+                    'q': rng.choice(('', '', 'time', 'zen art', 'a')), 'type': rng.choice(('',) + ITEM_TYPES),
+                    'sort': sort, 'limit': 50})
+                page = [d[sort] for d in res.get_json()]
+                if page != sorted(page):
+                    failures.append(f"GET /items?sort={sort} returned an unordered page")
+        with record:
+            created.extend(own)
+
+    rows = iter_catalog(threads * ops * 2, seed=1)
+    row_lock = threading.Lock()
+
+    class Rows:
+        def __next__(self):
+            with row_lock:
+                data = next(rows)
+            return {key: data[key] for key in ('type', 'title', 'author', 'year')}
+
+    catalog_rows = Rows()
+    with tempfile.TemporaryDirectory() as directory:
+        backend = use_catalog(storage, directory, durability)
+        start_ids = [d['id'] for d in backend.app.test_client().get('/items?sort=id').get_json()]
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        handed_out = created + deleted
+        if len(handed_out) != len(set(handed_out)):
+            failures.append(f"{len(handed_out) - len(set(handed_out))} ids were handed out twice")
+        expected = set(start_ids) | set(created)
+        listed = [d['id'] for d in backend.app.test_client().get('/items?sort=id').get_json()]
+        if set(listed) != expected or len(listed) != len(expected):
+            failures.append(f"GET /items lists {len(listed)} items, expected {len(expected)}")
+        if backend.catalog.facets() != count_facets(backend.catalog.query(sort='id').fetch(None, None)):
+            failures.append("facet counts disagree with the items")
+        if storage == 'json':
+            failures.extend(check_json_indexes(backend.catalog))
+        backend.catalog.close()
+
+        reloaded = use_catalog(storage, directory)
+        relisted = [d['id'] for d in reloaded.app.test_client().get('/items?sort=id').get_json()]
+        if relisted != listed:
+            failures.append("the catalog reloaded from disk differs from the one in memory")
+        reloaded.catalog.close()
+
+    result = {'storage': storage, 'durability': durability, 'threads': threads, 'ops_per_thread': ops,
+              'items': len(listed), 'failures': failures}
+    print(f"stress [{storage}, {durability}]: {threads} threads x {ops} ops, {len(listed)} items, "
+          f"{len(failures)} failures", file=sys.stderr)
+    for failure in failures:
+        print(f"  FAIL: {failure}", file=sys.stderr)
+    return result
+
+
+# --------------------------------------------------------------------------------
+# LIST ENDPOINT SERIALIZATION
+# --------------------------------------------------------------------------------
+
+def best_ms(fn, repeat):
+    """Fastest of `repeat` calls to fn(), in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def forget_encodings(items):
+    for item in items:
+        item._json = None
+
+
+def run_listing(sizes, repeat):
+    """
+    Times a full GET /items at each catalog size: the old as_dict() + jsonify path,
+    then the joined per-item encodings cold (first request after load) and warm,
+    with each available encoder, and finally a response-cache hit.
+    """
+    encoders = ['json'] + (['orjson'] if models.orjson is not None else [])
+    fast_encoder = models.orjson
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in sizes:
+            write_snapshot(os.path.join(directory, 'library_data.json'),
+                           [Item(**d) for d in iter_catalog(count)])
+            backend = use_catalog('json', directory)
+            client = backend.app.test_client()
+            items = list(backend.catalog.items.values())
+
+            def get_uncached():
+                backend.response_cache.clear()
+                assert client.get('/items').status_code == 200
+
+            def get_cold():
+                forget_encodings(items)
+                get_uncached()
+
+            def jsonify_all():
+                with backend.app.app_context():
+                    backend.jsonify([i.as_dict() for i in backend.catalog.query().fetch(None, None)]).get_data()
+
+            result = {'items': count, 'as_dict_jsonify_ms': best_ms(jsonify_all, repeat)}
+            for name in encoders:
+                models.orjson = fast_encoder if name == 'orjson' else None
+                result[f'{name}_cold_ms'] = best_ms(get_cold, repeat)
+                result[f'{name}_warm_ms'] = best_ms(get_uncached, repeat)
+            models.orjson = fast_encoder
+            client.get('/items')
+            result['cache_hit_ms'] = best_ms(lambda: client.get('/items'), repeat)
+            results.append(result)
+            backend.catalog.close()
+            print(f"{count:>9,} items: " + ', '.join(
+                f"{key[:-3]} {value:.1f} ms" for key, value in result.items() if key.endswith('_ms')),
+                file=sys.stderr)
+    return results
+
+
+# --------------------------------------------------------------------------------
+# COLD START
+# --------------------------------------------------------------------------------
+
+LOAD_MODES = ('json-full', 'json', 'binary')
+
+
+def measure_load(mode, path):
+    """
+    Loads the snapshot at `path` into an id -> Item dict, the way load_data() does
+    (json-full: the old json.load() of the whole document first), and reports the
+    time taken and the peak RSS growth.
+    """
+    before = rss_kb()
+    start = time.perf_counter()
+    if mode == 'json-full':
+        from catalog import item_from_dict
+        with open(path) as f:
+            items = {d.get('id'): item_from_dict(d) for d in json.load(f)}
+    else:
+        items = {item.id: item for item in read_snapshot(path, Item)}
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'items': len(items), 'seconds': seconds, 'peak_rss_kb': peak_kb - before}
+
+
+def run_load(sizes):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'library_data.json')
+        for count in sizes:
+            items = [Item(**d) for d in iter_catalog(count)]
+            write_snapshot(path, items)
+            write_snapshot(path, items, snapshot_format='binary')
+            del items
+            for mode in LOAD_MODES:
+                snapshot = binary_snapshot_path(path) if mode == 'binary' else path
+                out = subprocess.run(
+                    [sys.executable, __file__, '_load', mode, snapshot],
+                    check=True, capture_output=True, text=True).stdout
+                result = json.loads(out)
+                result.update(mode=mode, bytes=os.path.getsize(snapshot))
+                results.append(result)
+                print(f"{mode:>9} x {count:>9,}: {result['seconds']:6.2f} s, "
+                      f"peak {result['peak_rss_kb'] / 1024:7.1f} MiB, file {result['bytes'] / 2 ** 20:6.1f} MiB",
+                      file=sys.stderr)
+    return results
+
+
+# --------------------------------------------------------------------------------
+# LOAD GENERATOR
+# --------------------------------------------------------------------------------
+
+# Share of each operation in the request mix. 'list' and 'search' fetch the first
+# 200-row page, as the desktop client does; 'list_all' fetches the whole catalog.
+DEFAULT_MIX = {'list': 0.3, 'search': 0.4, 'list_all': 0.02, 'create': 0.14, 'delete': 0.14}
+OPERATIONS = tuple(DEFAULT_MIX)
+
+
+def populate(storage, directory, count):
+    """Creates a catalog of `count` synthetic items under `directory` for `storage`."""
+    if storage == 'json':
+        write_snapshot(os.path.join(directory, 'library_data.json'), (Item(**d) for d in iter_catalog(count)))
+        return
+    from catalog import open_catalog
+    catalog = open_catalog(storage, None, os.path.join(directory, 'items.db'))
+    catalog.load()
+    batch = []
+    for d in iter_catalog(count):
+        batch.append({key: d[key] for key in ('type', 'title', 'author', 'year')})
+        if len(batch) == 10_000:
+            catalog.create_many(batch)
+            batch = []
+    if batch:
+        catalog.create_many(batch)
+    catalog.close()
+
+
+class TestClientDriver:
+    """Sends requests through Flask's test client: the app's own cost, without HTTP."""
+    def __init__(self, backend):
+        self.client = backend.app.test_client()
+
+    def send(self, method, path, body=None):
+        res = self.client.open(path, method=method, json=body)
+        return res.status_code, res.get_json()
+
+
+class HttpDriver:
+    """Sends requests to a real server over one keep-alive connection."""
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def send(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        res = self.conn.getresponse()
+        data = res.read()
+        return res.status, json.loads(data) if data else None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_workload(make_driver, requests, threads, mix=None, seed=0):
+    """
+    Sends `requests` requests from `threads` threads, each with its own driver and
+    a seeded random sequence of operations drawn from `mix`. Returns latency
+    percentiles per operation and the overall throughput.
+    """
+    mix = mix or DEFAULT_MIX
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    latencies = {op: [] for op in operations}
+    errors = {op: 0 for op in operations}
+    record = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        rows = iter_catalog(requests, seed=seed * 1000 + index)
+        driver = make_driver()
+        own = []
+        local = {op: [] for op in operations}
+        failed = {op: 0 for op in operations}
+        for _ in range(requests // threads):
+            op = rng.choices(operations, weights)[0]
+            if op == 'delete' and not own:
+                op = 'create'
+            if op == 'list':
+                method, path, body, ok = 'GET', '/items?limit=200', None, 200
+            elif op == 'search':
+                method, path, body, ok = 'GET', f'/items?q={rng.choice(WORDS)}&limit=200', None, 200
+            elif op == 'list_all':
+                method, path, body, ok = 'GET', '/items', None, 200
+            elif op == 'create':
+                d = next(rows)
+                method, path, ok = 'POST', '/items', 201
+                body = {key: d[key] for key in ('type', 'title', 'author', 'year')}
+            else:
+                method, path, body, ok = 'DELETE', f'/items/{own.pop(rng.randrange(len(own)))}', None, 200
+            start = time.perf_counter()
+            try:
+                status, data = driver.send(method, path, body)
+            except Exception:
+                status, data = None, None
+            local[op].append(time.perf_counter() - start)
+            if status != ok:
+                failed[op] += 1
+            elif op == 'create':
+                own.append(data['id'])
+        with record:
+            for op in operations:
+                latencies[op].extend(local[op])
+                errors[op] += failed[op]
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    ops = {}
+    for op in operations:
+        values = sorted(latencies[op])
+        if not values:
+            continue
+        ops[op] = {
+            'count': len(values),
+            'errors': errors[op],
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        }
+    total = sum(op['count'] for op in ops.values())
+    return {
+        'requests': total,
+        'errors': sum(op['errors'] for op in ops.values()),
+        'elapsed_seconds': elapsed,
+        'requests_per_second': total / elapsed if elapsed else None,
+        'ops': ops,
+    }
+
+
+def process_rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+@contextlib.contextmanager
+def local_server(storage, directory, durability='sync'):
+    """Runs backend.py over the catalog in `directory` in a child process; yields (port, pid)."""
+    proc = subprocess.Popen(
+        [sys.executable, __file__, '_serve', storage, directory, '--durability', durability],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(proc.stdout.readline())
+        yield port, proc.pid
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def serve(storage, directory, durability='sync'):
+    """Serves the catalog in `directory` on a free port (threaded, like the dev server) and prints the port."""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    WSGIRequestHandler.log_request = lambda *args, **kwargs: None
+    backend = use_catalog(storage, directory, durability)
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def run_loadgen(size, requests, threads, target, storage, durability='sync'):
+    """Drives the request mix against a fresh catalog of `size` items; adds the RSS to the result."""
+    with tempfile.TemporaryDirectory() as directory:
+        populate(storage, directory, size)
+        if target == 'server':
+            with local_server(storage, directory, durability) as (port, pid):
+                result = run_workload(lambda: HttpDriver(port), requests, threads)
+                result['rss_kb'] = process_rss_kb(pid)
+        else:
+            backend = use_catalog(storage, directory, durability)
+            result = run_workload(lambda: TestClientDriver(backend), requests, threads)
+            result['rss_kb'] = rss_kb()
+            backend.catalog.close()
+    result.update(target=target, storage=storage, durability=durability, items=size, threads=threads)
+    print_workload(result)
+    return result
+
+
+def print_workload(result):
+    print(f"{result['target']} [{result['storage']}] {result['items']:,} items: "
+          f"{result['requests_per_second']:.0f} req/s, {result['errors']} errors, "
+          f"RSS {result['rss_kb'] / 1024:.1f} MiB", file=sys.stderr)
+    for op, stats in result['ops'].items():
+        print(f"  {op:>9}: p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+              f"p99 {stats['p99_ms']:8.2f} ms  ({stats['count']})", file=sys.stderr)
+
+
+# --------------------------------------------------------------------------------
+# REGRESSION SUITE
+# --------------------------------------------------------------------------------
+
+def time_call(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run_suite(sizes, storage, requests, threads, targets):
+    """
+    For each catalog size: load_data(), save_data() and a full list_items() timing,
+    then the request mix against each target. Metric names end in _seconds, _ms
+    or _kb (lower is better) or _per_second (higher is better); see compare.
+    """
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            populate(storage, directory, size)
+            import backend
+            backend.catalog.close()
+            from catalog import open_catalog
+            backend.catalog = open_catalog(storage, os.path.join(directory, 'library_data.json'),
+                                           os.path.join(directory, 'items.db'))
+            result = {'items': size, 'storage': storage,
+                      'load_data_seconds': time_call(backend.load_data)}
+            backend.response_cache.clear()
+            client = backend.app.test_client()
+            result['list_all_ms'] = time_call(lambda: client.get('/items')) * 1000
+            result['save_data_seconds'] = time_call(backend.save_data)
+            backend.catalog.close()
+        print(f"{size:>9,} items [{storage}]: load_data {result['load_data_seconds']:.3f} s, "
+              f"save_data {result['save_data_seconds']:.3f} s, list_items {result['list_all_ms']:.1f} ms",
+              file=sys.stderr)
+        for target in targets:
+            result[target] = run_loadgen(size, requests, threads, target, storage)
+        results.append(result)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'suite': results,
+    }
+
+
+def flatten_metrics(value, prefix=''):
+    """Maps dotted paths to numeric metrics, keying suite entries by storage and size."""
+    metrics = {}
+    if isinstance(value, dict):
+        for key, child in value.items():
+            metrics.update(flatten_metrics(child, f"{prefix}{key}."))
+    elif isinstance(value, list):
+        for child in value:
+            key = f"{child.get('storage')}-{child.get('items')}" if isinstance(child, dict) else len(metrics)
+            metrics.update(flatten_metrics(child, f"{prefix}{key}."))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        metrics[prefix[:-1]] = value
+    return metrics
+
+
+def compare_results(baseline, current, tolerance):
+    """Returns a line per metric that got worse than `baseline` by more than `tolerance` (a fraction)."""
+    old = flatten_metrics(baseline)
+    new = flatten_metrics(current)
+    regressions = []
+    for path in sorted(old.keys() & new.keys()):
+        before, after = old[path], new[path]
+        if path.endswith('_per_second'):
+            worse = after < before / (1 + tolerance)
+        elif path.endswith(('_seconds', '_ms', '_kb')):
+            worse = after > before * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{path}: {before:.4g} -> {after:.4g}")
+    return regressions
+
+
+def write_results(results, output):
+    text = json.dumps(results, indent=4)
+    print(text)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest='command', required=True)
+    memory = sub.add_parser('memory', help='compare RSS of the dict-based and __slots__ Item')
+    memory.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    stress = sub.add_parser('stress', help='hammer the API from many threads and check consistency')
+    stress.add_argument('--threads', type=int, default=16)
+    stress.add_argument('--ops', type=int, default=300)
+    stress.add_argument('--storage', choices=('json', 'sqlite'), default='json')
+    stress.add_argument('--durability', choices=DURABILITY_MODES, default='sync')
+    listing = sub.add_parser('listing', help='time full GET /items serialization')
+    listing.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    listing.add_argument('--repeat', type=int, default=5)
+    load = sub.add_parser('load', help='time loading JSON and binary snapshots')
+    load.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    load_one = sub.add_parser('_load')
+    load_one.add_argument('mode', choices=LOAD_MODES)
+    load_one.add_argument('path')
+    generate = sub.add_parser('generate', help='write a synthetic catalog snapshot')
+    generate.add_argument('--count', type=int, default=100_000)
+    generate.add_argument('--output', default='library_data.json')
+    generate.add_argument('--format', choices=('json', 'binary'), default='json')
+    generate.add_argument('--seed', type=int, default=0)
+    loadgen = sub.add_parser('loadgen', help='drive a list/search/create/delete mix and report latencies')
+    loadgen.add_argument('--size', type=int, default=10_000)
+    loadgen.add_argument('--requests', type=int, default=2000)
+    loadgen.add_argument('--threads', type=int, default=4)
+    loadgen.add_argument('--target', choices=('client', 'server'), default='client')
+    loadgen.add_argument('--storage', choices=('json', 'sqlite'), default='json')
+    loadgen.add_argument('--durability', choices=DURABILITY_MODES, default='sync')
+    suite = sub.add_parser('suite', help='load/save/list timings plus the request mix, per catalog size')
+    suite.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    suite.add_argument('--storage', choices=('json', 'sqlite'), default='json')
+    suite.add_argument('--requests', type=int, default=2000)
+    suite.add_argument('--threads', type=int, default=4)
+    suite.add_argument('--targets', choices=('client', 'server'), nargs='+', default=['client', 'server'])
+    suite.add_argument('--output')
+    compare = sub.add_parser('compare', help='list metrics that regressed between two suite results')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--tolerance', type=float, default=0.2)
+    serve_one = sub.add_parser('_serve')
+    serve_one.add_argument('storage', choices=('json', 'sqlite'))
+    serve_one.add_argument('directory')
+    serve_one.add_argument('--durability', choices=DURABILITY_MODES, default='sync')
+    measure = sub.add_parser('_measure')
+    measure.add_argument('model', choices=('dict', 'slots'))
+    measure.add_argument('count', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == '_measure':
+        item_class = DictItem if args.model == 'dict' else Item
+        print(json.dumps(measure_items(item_class, args.count)))
+    elif args.command == 'memory':
+        print(json.dumps({'memory': run_memory(args.sizes)}, indent=4))
+    elif args.command == 'stress':
+        result = run_stress(args.threads, args.ops, args.storage, args.durability)
+        print(json.dumps({'stress': result}, indent=4))
+        if result['failures']:
+            sys.exit(1)
+    elif args.command == '_load':
+        print(json.dumps(measure_load(args.mode, args.path)))
+    elif args.command == 'load':
+        print(json.dumps({'load': run_load(args.sizes)}, indent=4))
+    elif args.command == 'listing':
+        print(json.dumps({'listing': run_listing(args.sizes, args.repeat)}, indent=4))
+    elif args.command == 'generate':
+        write_snapshot(args.output, (Item(**d) for d in iter_catalog(args.count, args.seed)), args.format)
+        print(f"wrote {args.count:,} items", file=sys.stderr)
+    elif args.command == '_serve':
+        serve(args.storage, args.directory, args.durability)
+    elif args.command == 'loadgen':
+        result = run_loadgen(args.size, args.requests, args.threads, args.target, args.storage, args.durability)
+        print(json.dumps({'loadgen': result}, indent=4))
+    elif args.command == 'suite':
+        write_results(run_suite(args.sizes, args.storage, args.requests, args.threads, args.targets), args.output)
+    elif args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare_results(baseline, current, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regressions (tolerance {args.tolerance:.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
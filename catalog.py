@@ -0,0 +1,598 @@
+# catalog.py - the storage backends behind the /items API
+import heapq
+import threading
+from collections import deque
+from itertools import chain, islice
+
+import metrics
+from models import Item, ITEM_TYPES
+from storage import FLUSH_INTERVAL, WriteAheadLog, LogRotatedAway
+from indexes import SearchIndex, SortedIndex, FacetIndex, HashIndex, SORT_FIELDS, count_facets, year_bounds
+from rwlock import ReadWriteLock
+
+# FIX: Ensure all sample creation uses 'id=' and not 'item_id='
+SAMPLE_ITEMS = [
+    Item(id=1, type='book', title='The Pragmatic Engineer', author='John Doe', year=2020),
+    Item(id=2, type='magazine', title='Science Monthly', author='Editorial Team', year=2024),
+    Item(id=3, type='film', title='Space Adventure', author='Jane Director', year=2019),
+    Item(id=4, type='book', title='A Brief History of Time', author='Stephen Hawking', year=1988),
+    Item(id=5, type='book', title='Zen and the Art of Motorcycle Maintenance', author='Robert Pirsig', year=1974),
+]
+
+# Most recent changes kept for the change feed (GET /items/changes). Clients
+# further behind than this must reload the list.
+CHANGE_LOG_SIZE = 10000
+
+
+class ItemQuery:
+    """
+    A filtered, ordered view over a catalog, read page by page.
+    fetch(after, count) returns up to `count` items (all when None) that sort
+    strictly after the sort key `after`; key(item) gives an item's sort key.
+    Keys that cannot belong to this ordering raise ValueError or TypeError.
+    explain() describes how the backend answers the query, for debugging.
+    """
+    def __init__(self, fetch, key, explain=None):
+        self.fetch = fetch
+        self.key = key
+        self.explain = explain or (lambda: '')
+
+
+class ItemFilter:
+    """
+    What a query selects: `q` (lowercased) within the title or author, one
+    item type or several, an exact author, and years year_min..year_max
+    inclusive. Filters left as ''/None select everything.
+    """
+    __slots__ = ('q', 'types', 'author', 'year_min', 'year_max')
+
+    def __init__(self, q='', type_filter=None, author=None, year_min=None, year_max=None):
+        self.q = q
+        if isinstance(type_filter, str):
+            type_filter = [type_filter]
+        self.types = frozenset(type_filter) if type_filter else None
+        self.author = author
+        self.year_min = year_min
+        self.year_max = year_max
+
+    @property
+    def has_years(self):
+        return self.year_min is not None or self.year_max is not None
+
+    def checks(self, skip=None):
+        """(filter name, test) for every filter in use except `skip` ('q', 'type', 'author' or 'year')."""
+        checks = []
+        if self.types and skip != 'type':
+            types = self.types
+            checks.append(('type', lambda item: item.type in types))
+        if self.author is not None and skip != 'author':
+            author = self.author
+            checks.append(('author', lambda item: item.author == author))
+        if self.has_years and skip != 'year':
+            low = float('-inf') if self.year_min is None else self.year_min
+            high = float('inf') if self.year_max is None else self.year_max
+            checks.append(('year', lambda item: isinstance(item.year, int) and low <= item.year <= high))
+        if self.q and skip != 'q':
+            q = self.q
+            checks.append(('q', lambda item: q in (item.title or '').lower() or q in (item.author or '').lower()))
+        return checks
+
+    def matches(self, item):
+        return all(test(item) for _, test in self.checks())
+
+
+# --------------------------------------------------------------------------------
+# JSON / IN-MEMORY BACKEND
+# --------------------------------------------------------------------------------
+
+class JsonCatalog:
+    """
+    Keeps every item in memory with search and sorted indexes, persisted as
+    a JSON snapshot (library_data.json) plus an append-only log.
+
+    Safe under threaded WSGI servers: reads share a ReadWriteLock while
+    writes (including id allocation and index updates) hold it exclusively.
+    Log records are written inside the write lock, so their order matches
+    the order of the changes, but the fsync happens after the lock is released.
+
+    Safe across worker processes (e.g. gunicorn -w 4) sharing one data file:
+    writes also hold the log's file lock, and every request first checks the
+    shared version counter, applying other workers' log records to this
+    process's indexes incrementally when it has moved on.
+
+    With background_indexing=True, load() returns once the items are in memory
+    and the indexes are built on a thread. Until they are ready, queries scan
+    and sort the items directly, while writes (and catching up with other
+    workers) wait.
+
+    durability and flush_interval choose when changes reach the disk (see
+    storage.DURABILITY_MODES): with 'flush' or 'immediate', writes are
+    buffered and coalesced into one log write per flush_interval seconds.
+    """
+    def __init__(self, data_file_path, snapshot_format='json', background_indexing=False,
+                 durability='sync', flush_interval=FLUSH_INTERVAL):
+        self.data_file_path = data_file_path
+        self.background_indexing = background_indexing
+        self._lock = ReadWriteLock()
+        # id -> Item. Insertion-ordered, so it doubles as the catalog's natural
+        # order while giving O(1) lookup and delete by id.
+        self.items = {}
+        self.next_item_id = 1
+        self.search_index = SearchIndex()
+        self.facet_index = FacetIndex()
+        self.author_index = HashIndex('author')
+        # (type or None, sort field) -> SortedIndex. Every field is kept for the
+        # whole catalog; titles, the default order, are also partitioned per type.
+        self.sorted_indexes = {}
+        # Every create/update/delete is appended to <data file>.log; the log is
+        # folded back into the data file in the background once it grows large.
+        self.journal = WriteAheadLog(data_file_path, snapshot_source=lambda: self.items.values(),
+                                     snapshot_format=snapshot_format, durability=durability,
+                                     flush_interval=flush_interval)
+        # Clear while indexes are being built in the background.
+        self._indexes_ready = threading.Event()
+        self._indexes_ready.set()
+        # (seq, op, Item or id) per recent change, seq being the version it produced.
+        self.recent_changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self._changes_floor = 0  # the oldest `since` answerable while recent_changes is empty
+
+    # --- Loading and persistence ---
+
+    @property
+    def version(self):
+        """Number of changes ever logged; increases with every create/update/delete."""
+        # Catch up first so the version covers other workers' changes too.
+        self._refresh()
+        return self.journal.version
+
+    @property
+    def epoch(self):
+        """Changes whenever versions may start over (see storage.VersionFile); part of the ETag."""
+        return self.journal.epoch
+
+    def load(self):
+        """Loads media data from the JSON file into memory at startup."""
+        self._indexes_ready.wait()
+        with self._lock.write(), self.journal.lock.exclusive():
+            self._load(background=self.background_indexing)
+
+    def _load(self, background=False):
+        timer = metrics.PhaseTimer('load')
+        self.items = {}
+
+        # Check 1: If neither the file nor its log exist, create it with samples
+        if not self.journal.has_data():
+            print(f"Creating initial data file: {self.data_file_path}")
+            self.journal.load(Item)
+            self.items = {item.id: item for item in SAMPLE_ITEMS}
+            self._save()
+            self.next_item_id = len(self.items) + 1
+            timer.mark('read')
+            self._build_indexes(background)
+            self._reset_changes()
+            return
+
+        try:
+            # Check 2: Load the snapshot and replay the log written since it
+            self.items = self.journal.load(Item)
+            self.next_item_id = max(self.items) + 1 if self.items else 1
+        except Exception as e:
+            print(f"Error loading JSON data: {e}. Starting with empty data.")
+            self.items = {}
+            self.next_item_id = 1
+
+        timer.mark('read')
+        self._build_indexes(background)
+        self._reset_changes()
+
+    def save(self):
+        """Writes the current items to a fresh snapshot and starts a new, empty log."""
+        timer = metrics.PhaseTimer('save')
+        self._indexes_ready.wait()
+        with self._lock.write(), self.journal.lock.exclusive():
+            timer.mark('lock')
+            # The snapshot replaces the shared log, so it must include every worker's changes.
+            self._catch_up()
+            timer.mark('catch_up')
+            self._save()
+            timer.mark('write')
+
+    def _save(self):
+        try:
+            self.journal.compact(background=False)
+        except Exception as e:
+            print(f"CRITICAL ERROR: Failed to save JSON data: {e}")
+
+    def close(self):
+        self.journal.close()
+
+    def _log(self, append, *args):
+        # A failed append leaves memory ahead of disk, as a failed full rewrite did before.
+        try:
+            return append(*args, sync=False)
+        except Exception as e:
+            print(f"CRITICAL ERROR: Failed to append to JSON log: {e}")
+
+    def _sync(self, seq, timer):
+        # Called once the write lock is released, so concurrent writers share fsyncs.
+        if seq is None:
+            return
+        try:
+            self.journal.sync(seq)
+        except Exception as e:
+            print(f"CRITICAL ERROR: Failed to sync JSON log: {e}")
+        timer.mark('sync')
+
+    # --- Other workers ---
+
+    def _refresh(self):
+        # One read of the shared version counter when nothing has changed.
+        if self.journal.is_current():
+            return
+        self._indexes_ready.wait()
+        with self._lock.write(), self.journal.lock.exclusive():
+            self._catch_up()
+
+    def _catch_up(self):
+        """Applies changes other workers have logged since this one last looked (locks held)."""
+        if self.journal.is_current():
+            return
+        try:
+            records = self.journal.read_new()
+        except LogRotatedAway:
+            print("Other workers compacted past this worker's position; reloading the catalog.")
+            # Not in the background: the caller goes on to change self.items under these locks.
+            self._load()
+            return
+        first_seq = self.journal.version - len(records) + 1
+        for seq, record in enumerate(records, first_seq):
+            self.recent_changes.append((seq, record.get('op'), self._apply(record)))
+
+    def _apply(self, record):
+        """Applies one log record; returns the new Item, or the id for a delete."""
+        op = record.get('op')
+        if op in ('create', 'update'):
+            item = item_from_dict(record['item'])
+            old = self.items.get(item.id)
+            if old is not None:
+                self._unindex(old)
+                if op == 'create':
+                    del self.items[item.id]
+            self.items[item.id] = item
+            self._index(item)
+            self.next_item_id = max(self.next_item_id, item.id + 1)
+            return item
+        elif op == 'delete':
+            item = self.items.pop(record.get('id'), None)
+            if item is not None:
+                self._unindex(item)
+            return record.get('id')
+
+    # --- Change feed ---
+
+    def _reset_changes(self):
+        # After a (re)load nothing before the current version can be replayed.
+        self.recent_changes.clear()
+        self._changes_floor = self.journal.version
+
+    def _record_changes(self, op, values):
+        # Called right after the changes were logged, so they end at the current version.
+        first_seq = self.journal.version - len(values) + 1
+        self.recent_changes.extend((seq, op, value) for seq, value in enumerate(values, first_seq))
+
+    def changes(self, since, limit=None):
+        """
+        Returns up to `limit` (seq, op, Item or id) changes made after version
+        `since`, oldest first, or None if some of them are no longer kept.
+        """
+        self._refresh()
+        with self._lock.read():
+            log = self.recent_changes
+            floor = log[0][0] - 1 if log else self._changes_floor
+            if since < floor or since > self.journal.version:
+                return None
+            # Sequence numbers are consecutive, so `since` gives the position directly.
+            start = since - floor
+            return list(islice(log, start, None if limit is None else start + limit))
+
+    # --- Indexes ---
+
+    def _build_indexes(self, background):
+        if not background:
+            timer = metrics.PhaseTimer('load')
+            self.rebuild_indexes()
+            timer.mark('index')
+            return
+        # Nothing changes self.items meanwhile: writes and catch-ups wait for the event.
+        self._indexes_ready.clear()
+        threading.Thread(target=self._build_indexes_in_background, daemon=True).start()
+
+    def _build_indexes_in_background(self):
+        timer = metrics.PhaseTimer('load')
+        try:
+            self.rebuild_indexes()
+            timer.mark('index')
+        except Exception as e:
+            print(f"CRITICAL ERROR: Failed to build indexes: {e}")
+        finally:
+            self._indexes_ready.set()
+
+    def wait_for_indexes(self, timeout=None):
+        """Blocks until background index construction (if any) is done; returns False on timeout."""
+        return self._indexes_ready.wait(timeout)
+
+    def rebuild_indexes(self):
+        """Rebuilds every in-memory index from self.items."""
+        items = self.items.values()
+        self.search_index = SearchIndex()
+        for item in items:
+            self.search_index.add(item)
+        self.facet_index = FacetIndex(items)
+        self.author_index = HashIndex('author', items)
+        self.sorted_indexes = {(None, field): SortedIndex(field, items) for field in SORT_FIELDS}
+        for type_ in ITEM_TYPES:
+            self.sorted_indexes[(type_, 'title')] = SortedIndex('title', (i for i in items if i.type == type_))
+
+    def _sorted_indexes_for(self, item):
+        keys = [(None, field) for field in SORT_FIELDS]
+        if item.type in ITEM_TYPES:
+            keys.append((item.type, 'title'))
+        return [self.sorted_indexes[key] for key in keys]
+
+    def _index(self, item):
+        self.search_index.add(item)
+        self.facet_index.add(item)
+        self.author_index.add(item)
+        for index in self._sorted_indexes_for(item):
+            index.add(item)
+
+    def _unindex(self, item):
+        self.search_index.remove(item)
+        self.facet_index.remove(item)
+        self.author_index.remove(item)
+        for index in self._sorted_indexes_for(item):
+            index.remove(item)
+
+    # --- Reads ---
+
+    def get(self, item_id):
+        self._refresh()
+        with self._lock.read():
+            return self.items.get(item_id)
+
+    def query(self, q='', type_filter=None, sort='title', descending=False,
+              author=None, year_min=None, year_max=None):
+        """
+        Returns an ItemQuery over the items matching `q` (lowercased),
+        `type_filter` (one type or several), `author` exactly and the years
+        year_min..year_max; see ItemFilter.
+        """
+        filters = ItemFilter(q, type_filter, author, year_min, year_max)
+        self._refresh()
+        with self._lock.read():
+            if not self._indexes_ready.is_set():
+                metrics.QUERY_PLANS.labels('scan').inc()
+                return self._item_query(SortedIndex(sort, self._scan(filters)), None, descending,
+                                        'scan every item (indexes are still being built)')
+            name, plan, index, predicate = self._plan(filters, sort)
+            metrics.QUERY_PLANS.labels(name).inc()
+            return self._item_query(index, predicate, descending, plan)
+
+    def _plan(self, filters, sort):
+        """
+        Chooses how to answer a query (read lock held). Each filter with an
+        index offers its candidates along with a cheap count of them; the
+        smallest set is fetched first and the other filters are checked per
+        candidate, so the work follows the most selective filter. `q` is only
+        searched when no other index narrows things down as well. Returns
+        (plan name, plan description, SortedIndex to walk, predicate or None).
+        """
+        full = self.sorted_indexes[(None, sort)]
+        drivers = []  # (candidate count, filter name, candidates())
+        if filters.author is not None:
+            by_author = self.author_index.get(filters.author)
+            drivers.append((len(by_author), 'author', by_author.values))
+        if filters.has_years:
+            low, high = year_bounds(filters.year_min, filters.year_max)
+            by_year = self.sorted_indexes[(None, 'year')]
+            drivers.append((by_year.count_between(low, high), 'year', lambda: by_year.between(low, high)))
+        if filters.types and filters.types <= set(ITEM_TYPES):
+            partitions = [self.sorted_indexes[(type_, 'title')] for type_ in sorted(filters.types)]
+            drivers.append((sum(map(len, partitions)), 'type', lambda: chain.from_iterable(partitions)))
+        best = min(drivers, key=lambda driver: driver[0], default=None)
+        selective = best is not None and best[0] * 8 < len(full)
+
+        if filters.q and not selective:
+            # Only items sharing a token with q are ever looked at
+            name = 'search'
+            candidates = self.search_index.search(filters.q)
+        elif selective:
+            name = best[1]
+            candidates = list(best[2]())
+        else:
+            # Nothing narrows much: walk the sort order, checking each item on the way.
+            index = None
+            if filters.types and len(filters.types) == 1:
+                index = self.sorted_indexes.get((next(iter(filters.types)), sort))
+            name, skip = ('sorted_partition', 'type') if index is not None else ('sorted', None)
+            predicate, checked = _combine(filters.checks(skip))
+            plan = f"walk {name.replace('_', ' ')} index by {sort} ({len(index or full)} items)" + checked
+            return name, plan, index or full, predicate
+
+        plan = f"{name} index ({len(candidates)} candidates)"
+        predicate, checked = _combine(filters.checks(name if name != 'search' else 'q'))
+        matches = candidates if predicate is None else [item for item in candidates if predicate(item)]
+        plan += checked
+        if len(matches) * 8 < len(full):
+            return name, f"{plan} > sort {len(matches)} by {sort}", SortedIndex(sort, matches), None
+        match_ids = {item.id for item in matches}
+        return (f"{name}_filter", f"{plan} > walk sorted index by {sort} ({len(full)} items), keeping {len(matches)}",
+                full, lambda item: item.id in match_ids)
+
+    def _scan(self, filters):
+        return [item for item in self.items.values() if filters.matches(item)]
+
+    def facets(self, q='', type_filter=None, author=None, year_min=None, year_max=None):
+        """
+        Returns {facet: Counter(value -> item count)} over the items matching
+        the filters (see query()). Filtered by type alone, the counts come
+        straight from the facet index; otherwise the query's matches are counted.
+        """
+        filters = ItemFilter(q, type_filter, author, year_min, year_max)
+        self._refresh()
+        with self._lock.read():
+            if not self._indexes_ready.is_set():
+                metrics.QUERY_PLANS.labels('facets_scan').inc()
+                return count_facets(self._scan(filters))
+            if not (filters.q or filters.author is not None or filters.has_years):
+                metrics.QUERY_PLANS.labels('facets_summary').inc()
+                return self.facet_index.counts(filters.types)
+            name, _, index, predicate = self._plan(filters, 'id')
+            metrics.QUERY_PLANS.labels(f'facets_{name}').inc()
+            return count_facets(index if predicate is None else filter(predicate, index))
+
+    def fuzzy_search(self, q, limit, type_filter=None, author=None, year_min=None, year_max=None):
+        """
+        Returns up to `limit` items matching the words of `q` (lowercased) with
+        typos tolerated, most relevant first; the other filters are as in
+        query(). Only items sharing a similar word with `q` are ever scored,
+        so this waits for the indexes rather than scanning every item.
+        """
+        predicate, _ = _combine(ItemFilter('', type_filter, author, year_min, year_max).checks())
+        self._refresh()
+        self._indexes_ready.wait()
+        with self._lock.read():
+            metrics.QUERY_PLANS.labels('fuzzy').inc()
+            scored = ((score, self.items[item_id]) for item_id, score in self.search_index.fuzzy_search(q).items())
+            if predicate:
+                scored = ((score, item) for score, item in scored if predicate(item))
+            return [item for _, item in heapq.nsmallest(limit, scored, key=_relevance)]
+
+    def _item_query(self, index, predicate, descending, plan):
+        def fetch(after, count):
+            # Keyset pagination: resuming from a sort key (not an offset) stays
+            # stable while other requests insert and delete items.
+            self._refresh()
+            with self._lock.read():
+                ordered = index.iter_after(after, descending)
+                if predicate:
+                    ordered = filter(predicate, ordered)
+                return list(ordered) if count is None else list(islice(ordered, count))
+
+        return ItemQuery(fetch, index.key, lambda: plan)
+
+    # --- Writes ---
+
+    def create(self, fields):
+        """Adds one item built from validated `fields`; returns it."""
+        return self.create_many([fields])[0]
+
+    def create_many(self, rows):
+        """Adds an item per validated field dict and persists them with one log write."""
+        created = []
+        timer = metrics.PhaseTimer('create')
+        self._indexes_ready.wait()
+        with self._lock.write(), self.journal.lock.exclusive():
+            timer.mark('lock')
+            self._catch_up()
+            for fields in rows:
+                new_item = Item(id=self.next_item_id, **fields)
+                self.next_item_id += 1
+                self.items[new_item.id] = new_item
+                self._index(new_item)
+                created.append(new_item)
+            timer.mark('apply')
+            if len(created) == 1:
+                seq = self._log(self.journal.append_create, created[0])
+            else:
+                seq = self._log(self.journal.append_creates, created)
+            if seq is not None:
+                self._record_changes('create', created)
+            timer.mark('log')
+        self._sync(seq, timer)
+        return created
+
+    def update(self, item_id, fields):
+        """Applies validated `fields` to an item; returns the new Item, or None if unknown."""
+        timer = metrics.PhaseTimer('update')
+        self._indexes_ready.wait()
+        with self._lock.write(), self.journal.lock.exclusive():
+            timer.mark('lock')
+            self._catch_up()
+            item = self.items.get(item_id)
+            if item is None:
+                return None
+            # Items are never edited in place: index entries are keyed on the old
+            # field values, and compaction may be writing the old object out.
+            updated = Item(**dict(item.as_dict(), **fields))
+            self._unindex(item)
+            self.items[item_id] = updated
+            self._index(updated)
+            timer.mark('apply')
+            seq = self._log(self.journal.append_update, updated)
+            if seq is not None:
+                self._record_changes('update', [updated])
+            timer.mark('log')
+        self._sync(seq, timer)
+        return updated
+
+    def delete(self, item_id):
+        """Removes an item; returns False if there was no such id."""
+        timer = metrics.PhaseTimer('delete')
+        self._indexes_ready.wait()
+        with self._lock.write(), self.journal.lock.exclusive():
+            timer.mark('lock')
+            self._catch_up()
+            item = self.items.pop(item_id, None)
+            if item is None:
+                return False
+            self._unindex(item)
+            timer.mark('apply')
+            seq = self._log(self.journal.append_delete, item_id)
+            if seq is not None:
+                self._record_changes('delete', [item_id])
+            timer.mark('log')
+        self._sync(seq, timer)
+        return True
+
+
+def _combine(checks):
+    """One predicate for all of ItemFilter.checks() (None if there are none), and a note naming them for plans."""
+    if not checks:
+        return None, ''
+    note = f" > check {', '.join(name for name, _ in checks)}"
+    if len(checks) == 1:
+        return checks[0][1], note
+    tests = [test for _, test in checks]
+    return (lambda item: all(test(item) for test in tests)), note
+
+
+def _relevance(scored):
+    # Highest score first; ties in title order, like an unranked listing.
+    score, item = scored
+    return -score, item.title or '', item.id
+
+
+def item_from_dict(item_data):
+    return Item(
+        id=item_data.get('id'), # FIX: Ensure constructor call uses 'id'
+        type=item_data.get('type'),
+        title=item_data.get('title'),
+        author=item_data.get('author'),
+        year=item_data.get('year')
+    )
+
+
+def open_catalog(backend, data_file_path, sqlite_path, snapshot_format='json', background_indexing=False,
+                 durability='sync', flush_interval=FLUSH_INTERVAL):
+    """
+    Returns the catalog for the configured storage backend ('json' or 'sqlite').
+    snapshot_format, background_indexing, durability and flush_interval only
+    apply to the JSON backend.
+    """
+    if backend == 'json':
+        return JsonCatalog(data_file_path, snapshot_format, background_indexing, durability, flush_interval)
+    if backend == 'sqlite':
+        from sqlite_catalog import SQLiteCatalog
+        return SQLiteCatalog(sqlite_path)
+    raise ValueError(f"unknown storage backend: {backend}")
@@ -1,10 +1,76 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import tkinter.font as tkfont
+import bisect
+import queue
+import threading
 import requests
 
 # The API address MUST match your running Flask server
 API = "http://127.0.0.1:5000/items"
+REQUEST_TIMEOUT = 10 # seconds
+# Search-as-you-type waits this long after the last keystroke before querying
+SEARCH_DEBOUNCE_MS = 300
+# How often the Tk loop picks up finished API calls
+POLL_MS = 30
+# Rows fetched per request; the next page is fetched as the table nears its end
+PAGE_SIZE = 200
+# Pages kept in the table. Beyond that, the page furthest from the view is
+# dropped, and fetched again by its cursor if the user scrolls back to it.
+MAX_PAGES = 3
+# Change feed long-polls wait this long for news (seconds; the server caps it at 60)
+CHANGES_WAIT = 25
+# Delay before polling the change feed again after a failure
+CHANGES_RETRY_MS = 5000
+
+
+def _row_key(item):
+    """An item's position in the table: the server's default (title, id) order."""
+    return (item["title"] or '', item["id"])
+
+
+class ApiWorker:
+    """
+    Runs API calls on a background thread over one keep-alive requests.Session,
+    so the Tk main loop never waits on the network. Results are handed back to
+    the Tk thread, which polls for them with root.after (Tk is not thread-safe).
+    """
+    def __init__(self, root):
+        self.root = root
+        self.session = requests.Session()
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+        self.root.after(POLL_MS, self._poll)
+
+    def submit(self, call, on_success, on_error, is_current=None):
+        """
+        Queues call(session). on_success(result) or on_error(exception) then runs
+        on the Tk thread. If is_current() turns False the call is skipped when
+        not yet sent, and its result dropped when it arrives.
+        """
+        self._jobs.put((call, on_success, on_error, is_current))
+
+    def _run(self):
+        while True:
+            call, on_success, on_error, is_current = self._jobs.get()
+            if is_current and not is_current():
+                continue
+            try:
+                self._results.put((on_success, call(self.session), is_current))
+            except Exception as e:
+                self._results.put((on_error, e, is_current))
+
+    def _poll(self):
+        while True:
+            try:
+                callback, value, is_current = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if not is_current or is_current():
+                callback(value)
+        self.root.after(POLL_MS, self._poll)
+
 
 class InventoryApp:
     def __init__(self, root):
@@ -14,6 +80,22 @@ class InventoryApp:
         
         # --- Theme State ---
         self.is_dark = False # Set LIGHT mode as DEFAULT
+
+        # --- API State ---
+        self.api = ApiWorker(root)
+        self._query_seq = 0 # bumped per load_items(); older queries are stale
+        self._search_after = None # pending debounced search
+        # Rows of the current query in the table, in the server's (title, id) order
+        self._row_keys = []
+        self._params = {}
+        self._next_cursor = None # None once the last page is loaded
+        self._page_pending = False
+        self._pages = [] # [cursor, row count] per page in the table (see Row Window)
+        self._dropped_above = [] # cursors of the pages dropped above them
+        self._stripe = 0 # rows dropped above minus rows restored, for the odd/even tags
+        # Changes are long-polled on their own worker so they never hold up other calls
+        self.feed = ApiWorker(root)
+        self._change_seq = None # position in the server's change feed
         
         # --- Color Definitions (Used in both themes) ---
         self.ACCENT_SEARCH = '#e69138' # Orange
@@ -55,7 +137,7 @@ class InventoryApp:
 
         self.tree = ttk.Treeview(self.tree_frame, columns=columns, show="headings")
         self.vsb = ttk.Scrollbar(self.tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscroll=self.vsb.set)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
         
         for col in columns:
             self.tree.heading(col, text=col.capitalize())
@@ -74,9 +156,9 @@ class InventoryApp:
         
         self._create_form_widgets()
 
-        # Apply default theme (Light Mode) and load data
+        # Apply default theme (Light Mode), then load data once the change feed position is known
         self._apply_light_theme()
-        self.load_items(reapply_theme=False)
+        self._follow_changes()
     
     # --- Theme Logic ---
 
@@ -202,11 +284,13 @@ class InventoryApp:
                                      font=self.big_font,
                                      bd=0, relief='flat', highlightthickness=1)
         self.search_entry.pack(side=tk.LEFT, padx=12, ipady=6)
+        self.search_entry.bind('<KeyRelease>', self._schedule_search)
 
         ttk.Label(self.search_frame, text="Type:").pack(side=tk.LEFT, padx=(12, 0))
         self.type_filter = ttk.Combobox(self.search_frame, values=["", "book", "magazine", "film"], width=14, font=self.big_font, state="readonly")
         self.type_filter.pack(side=tk.LEFT, padx=(8, 12))
         self.type_filter.set("")
+        self.type_filter.bind('<<ComboboxSelected>>', lambda e: self.load_items())
         
         self.search_btn = tk.Button(self.search_frame, text="Search", command=self.load_items, bg=self.ACCENT_SEARCH, fg='white', activebackground='#c47a30', relief='flat', font=self.btn_font, bd=0)
         self.search_btn.pack(side=tk.LEFT, padx=(0,8), ipadx=12, ipady=8)
@@ -278,36 +362,242 @@ class InventoryApp:
         else:
             self._apply_dark_theme()
         
-        # Reload items to update row colors and refresh placeholder
-        self.load_items(reapply_theme=False)
+        # Row colors follow the 'odd'/'even' tags, so the rows need no reload
         self._add_placeholder(self.search_entry)
 
-    # --- API and Data Functions (Remain the same) ---
+    # --- API and Data Functions ---
+    # Every request runs on self.api's thread; the callbacks run back on the Tk thread.
+
+    def _schedule_search(self, event=None):
+        """Search-as-you-type: (re)starts the debounce timer on each keystroke."""
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+        self._search_after = self.root.after(SEARCH_DEBOUNCE_MS, self.load_items)
 
     def load_items(self, reapply_theme=True):
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+            self._search_after = None
+
         params = {}
         q = self.search_entry.get().strip()
         if q and q != getattr(self, '_placeholder_text', ''): params["q"] = q
         if self.type_filter.get().strip(): params["type"] = self.type_filter.get().strip()
 
-        try:
-            res = requests.get(API, params=params)
-            data = res.json()
-        except requests.exceptions.ConnectionError:
+        # A newer load_items() makes this query stale: it is skipped if still queued
+        # and its result is ignored if already in flight.
+        self._query_seq += 1
+        self._params = params
+        self._fetch_page(None)
+
+    def _fetch_page(self, cursor, direction='first'):
+        """
+        Requests the page of the current query after `cursor`: the first page,
+        the next one ('down') or, when scrolling back up, a page dropped
+        earlier ('up'), which runs until the first row still loaded.
+        """
+        seq = self._query_seq
+        params = dict(self._params, limit=PAGE_SIZE)
+        top = self._row_keys[0] if direction == 'up' and self._row_keys else None
+
+        def fetch(session):
+            # Items added since the page was dropped may have pushed the
+            # loaded rows more than a page away; the requests in between
+            # become pages of their own, (cursor, rows) each.
+            pages, after = [], cursor
+            while True:
+                if after: params["cursor"] = after
+                res = session.get(API, params=params, timeout=REQUEST_TIMEOUT)
+                page = res.json()
+                if pages and page and _row_key(page[0]) >= top:
+                    return pages, after
+                pages.append((after, page))
+                after = res.headers.get('X-Next-Cursor')
+                if top is None or not page or not after or _row_key(page[-1]) >= top:
+                    return pages, after
+
+        self._page_pending = True
+        self.api.submit(fetch,
+                        lambda result: self._show_page(*result, direction=direction),
+                        lambda error: self._load_failed(error, direction),
+                        is_current=lambda: seq == self._query_seq)
+
+    def _on_tree_scroll(self, first, last):
+        """Scrollbar updates double as the trigger for fetching the next (or previous) page."""
+        self.vsb.set(first, last)
+        if self._page_pending:
+            return
+        if float(last) > 0.9 and self._next_cursor:
+            self._fetch_page(self._next_cursor, 'down')
+        elif float(first) < 0.1 and self._dropped_above:
+            self._fetch_page(self._dropped_above[-1], 'up')
+
+    def _load_failed(self, error, direction='first'):
+        self._page_pending = False
+        if isinstance(error, requests.exceptions.ConnectionError):
             messagebox.showerror("Connection Error", "Could not connect to the Flask API. Ensure the backend is running.")
-            data = []
-        except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
-            data = []
-
-        for i in self.tree.get_children(): self.tree.delete(i)
+        else:
+            messagebox.showerror("Error", f"An unexpected error occurred: {error}")
+        if direction == 'first':
+            self._show_page([(None, [])], None)
+
+    def _show_page(self, pages, next_cursor, direction='first'):
+        self._page_pending = False
+        # Only the page next to the loaded rows is shown; the others stay dropped
+        cursor, data = pages[-1]
+        if direction == 'first':
+            self.tree.delete(*self.tree.get_children())
+            self._row_keys = []
+            self._pages = []
+            self._dropped_above = []
+            self._stripe = 0
+        elif self.tree.exists('empty') and data:
+            self.tree.delete('empty')
+        if direction == 'up':
+            self._dropped_above.pop()
+            self._dropped_above += [page_cursor for page_cursor, _ in pages[:-1]]
+            # Rows from the first loaded one on are already shown
+            if self._row_keys:
+                data = [item for item in data if _row_key(item) < self._row_keys[0]]
+            self._keep_view(len(data), lambda: self._prepend_rows(data))
+            self._pages.insert(0, [cursor, len(data)])
+            if len(self._pages) > MAX_PAGES:
+                self._next_cursor = self._pages[-1][0]
+                self._drop_rows(len(self._row_keys) - self._pages.pop()[1], len(self._row_keys))
+        else:
+            self._next_cursor = next_cursor
+            for item in data:
+                self._insert_row(len(self._row_keys), item)
+            self._pages.append([cursor, len(data)])
+            if len(self._pages) > MAX_PAGES:
+                cursor, count = self._pages.pop(0)
+                self._dropped_above.append(cursor)
+                self._keep_view(-count, lambda: self._drop_rows(0, count))
+                self._stripe += count
+        self._show_empty_row()
+
+    def _show_empty_row(self):
+        if not self._row_keys and not self.tree.exists('empty'):
+            self.tree.insert("", tk.END, iid='empty', values=("", "", "No items found in inventory.", "", ""), tags=('odd',))
+
+    # --- Row Window ---
+    # At most MAX_PAGES pages of rows are in the table. self._pages holds, per
+    # loaded page, the cursor it was fetched with and its current row count;
+    # self._dropped_above the cursors of the pages dropped above them.
+
+    def _prepend_rows(self, data):
+        # Striping continues from the rows below, so none of them need re-tagging
+        self._stripe -= len(data)
+        for index, item in enumerate(data):
+            self._insert_row(index, item)
+
+    def _drop_rows(self, start, stop):
+        self.tree.delete(*self.tree.get_children()[start:stop])
+        del self._row_keys[start:stop]
+
+    def _keep_view(self, added, change):
+        """Runs change(), which adds (or removes, if negative) `added` rows at the top, keeping the same rows in view."""
+        top = float(self.tree.yview()[0]) * len(self._row_keys)
+        change()
+        if self._row_keys:
+            self.tree.yview_moveto(max(top + added, 0) / len(self._row_keys))
+
+    def _page_at(self, index):
+        """The self._pages entry holding row `index`."""
+        for page in self._pages:
+            if index < page[1]:
+                return page
+            index -= page[1]
+        return self._pages[-1]
+
+    # --- Incremental Row Updates ---
+
+    def _insert_row(self, index, item):
+        self.tree.insert("", index, iid=str(item["id"]), values=(item["id"], item["type"], item["title"], item["author"], item["year"]), tags=(self._stripe_tag(index),))
+        self._row_keys.insert(index, _row_key(item))
+
+    def _stripe_tag(self, index):
+        return 'even' if (index + self._stripe) % 2 == 0 else 'odd'
+
+    def _retag_rows(self, start):
+        """Restores the odd/even striping of the rows from `start` on, after a row above them came or went."""
+        for index, iid in enumerate(self.tree.get_children()[start:], start):
+            self.tree.item(iid, tags=(self._stripe_tag(index),))
+
+    def _matches_query(self, item):
+        """Mirrors the server's filtering: `type` exactly, `q` as a substring of title or author."""
+        if self._params.get("type") and item["type"] != self._params["type"]:
+            return False
+        q = self._params.get("q", "").lower()
+        return not q or q in (item["title"] or '').lower() or q in (item["author"] or '').lower()
+
+    def _add_row(self, item):
+        """Shows a new or updated item if it belongs in the rows loaded so far."""
+        self._remove_row(item["id"])
+        if not self._matches_query(item) or not self._pages:
+            return
+        key = _row_key(item)
+        # Outside the loaded rows, the item will arrive with the page it falls in.
+        if self._next_cursor and (not self._row_keys or key > self._row_keys[-1]):
+            return
+        if self._dropped_above and (not self._row_keys or key < self._row_keys[0]):
+            return
+        if self.tree.exists('empty'):
+            self.tree.delete('empty')
+        index = bisect.bisect(self._row_keys, key)
+        self._page_at(index)[1] += 1
+        self._insert_row(index, item)
+        self._retag_rows(index + 1)
+
+    def _remove_row(self, item_id):
+        iid = str(item_id)
+        if not self.tree.exists(iid):
+            return
+        index = self.tree.index(iid)
+        self._page_at(index)[1] -= 1
+        del self._row_keys[index]
+        self.tree.delete(iid)
+        self._retag_rows(index)
+        if not self._next_cursor:
+            self._show_empty_row()
+
+    # --- Change Feed ---
+
+    def _follow_changes(self):
+        """Long-polls GET /items/changes; each answer is applied to the table, then polled again."""
+        since = self._change_seq
+
+        def poll(session):
+            # Without `since` the server just reports the current position.
+            params = {} if since is None else {"since": since, "wait": CHANGES_WAIT}
+            res = session.get(f"{API}/changes", params=params, timeout=CHANGES_WAIT + REQUEST_TIMEOUT)
+            return res.status_code, res.json()
+
+        self.feed.submit(poll, self._apply_changes, self._changes_failed)
+
+    def _apply_changes(self, result):
+        status, body = result
+        if status == 200 and self._change_seq is not None:
+            for change in body["changes"]:
+                if change["op"] == "delete":
+                    self._remove_row(change["id"])
+                else:
+                    self._add_row(change["item"])
+            self._change_seq = body["seq"]
+        elif status in (200, 410):
+            # Starting out, or too far behind to catch up: load the list as of this position.
+            self._change_seq = body["seq"]
+            self.load_items()
+        else:
+            self.root.after(CHANGES_RETRY_MS, self._follow_changes)
+            return
+        self._follow_changes()
 
-        for idx, item in enumerate(data):
-            tag = 'even' if idx % 2 == 0 else 'odd'
-            self.tree.insert("", tk.END, values=(item["id"], item["type"], item["title"], item["author"], item["year"]), tags=(tag,))
-        
-        if not data:
-             self.tree.insert("", tk.END, values=("", "", "No items found in inventory.", "", ""), tags=('odd',))
+    def _changes_failed(self, error):
+        if self._change_seq is None and not self._row_keys and not self.tree.exists('empty'):
+            # Never connected: let load_items() report the error once.
+            self.load_items()
+        self.root.after(CHANGES_RETRY_MS, self._follow_changes)
 
     def reset_filters(self):
         self.search_entry.delete(0, tk.END)
@@ -328,15 +618,26 @@ class InventoryApp:
             "author": self.author_entry.get(),
             "year": int(self.year_entry.get() or 0)
         }
-        try:
-            res = requests.post(API, json=payload)
-            if res.status_code == 201:
-                self.load_items(); self.reset_form()
+
+        def post(session):
+            res = session.post(API, json=payload, timeout=REQUEST_TIMEOUT)
+            return res.status_code, res.json()
+
+        def done(result):
+            status, body = result
+            if status == 201:
+                self._add_row(body); self.reset_form()
                 messagebox.showinfo("Success", "Item Added")
             else:
-                messagebox.showerror("Error", res.json().get('error', 'Failed to add item'))
-        except requests.exceptions.ConnectionError:
+                messagebox.showerror("Error", body.get('error', 'Failed to add item'))
+
+        self.api.submit(post, done, self._request_failed)
+
+    def _request_failed(self, error):
+        if isinstance(error, requests.exceptions.ConnectionError):
             messagebox.showerror("Connection Error", "Could not connect to API.")
+        else:
+            messagebox.showerror("Error", f"An unexpected error occurred: {error}")
 
     def delete_item(self):
         selected = self.tree.selection()
@@ -350,17 +651,19 @@ class InventoryApp:
              return
              
         item_id = item_data[0]
-        
-        try:
-            res = requests.delete(f"{API}/{item_id}")
-            if res.status_code == 200:
-                self.load_items(); messagebox.showinfo("Deleted", "Item removed")
-            elif res.status_code == 404:
-                messagebox.showwarning("Not Found", "Item already deleted or not found."); self.load_items()
+
+        def delete(session):
+            return session.delete(f"{API}/{item_id}", timeout=REQUEST_TIMEOUT).status_code
+
+        def done(status):
+            if status == 200:
+                self._remove_row(item_id); messagebox.showinfo("Deleted", "Item removed")
+            elif status == 404:
+                messagebox.showwarning("Not Found", "Item already deleted or not found."); self._remove_row(item_id)
             else:
                 messagebox.showerror("Error", "Failed to delete item.")
-        except requests.exceptions.ConnectionError:
-            messagebox.showerror("Connection Error", "Could not connect to API.")
+
+        self.api.submit(delete, done, self._request_failed)
 
 if __name__ == '__main__':
     root = tk.Tk()
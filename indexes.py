@@ -0,0 +1,384 @@
+# indexes.py - in-memory secondary indexes over the media catalog
+import bisect
+from collections import Counter
+
+SORT_FIELDS = ('title', 'year', 'author', 'id')
+
+# Item counts GET /items/facets can report. Years are counted per decade.
+FACETS = ('type', 'year', 'author')
+YEAR_BUCKET = 10
+
+# Fuzzy search (mode=fuzzy) compares each query word with at most this many
+# indexed words: those sharing the most bigrams with it.
+FUZZY_MAX_TOKENS = 64
+
+
+class SearchIndex:
+    """
+    Answers the `q` substring filter of GET /items without scanning every item.
+
+    Titles and authors are lowercased once and split into whitespace tokens.
+    A token index maps each token to the ids of the items containing it, and a
+    trigram index over that (much smaller) token vocabulary finds the tokens
+    containing a query fragment. Matches are identical to
+    `q in title.lower() or q in author.lower()`.
+    """
+    def __init__(self):
+        self._docs = {}      # item id -> (item, lowered title, lowered author)
+        self._postings = {}  # token -> set of item ids
+        self._trigrams = {}  # trigram -> set of tokens
+        self._bigrams = {}   # (token length, bigram of the padded token) -> set of tokens, for fuzzy search
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, item):
+        """Indexes `item`, replacing any previous entry with the same id."""
+        if item.id in self._docs:
+            self.remove(item)
+        title = (item.title or '').lower()
+        author = (item.author or '').lower()
+        self._docs[item.id] = (item, title, author)
+        for token in set(title.split()) | set(author.split()):
+            ids = self._postings.get(token)
+            if ids is None:
+                ids = self._postings[token] = set()
+                for gram in _trigrams(token):
+                    self._trigrams.setdefault(gram, set()).add(token)
+                for gram in word_bigrams(token):
+                    self._bigrams.setdefault((len(token), gram), set()).add(token)
+            ids.add(item.id)
+
+    def remove(self, item):
+        """Drops `item` (matched by id) from the index; unknown ids are ignored."""
+        doc = self._docs.pop(item.id, None)
+        if doc is None:
+            return
+        _, title, author = doc
+        for token in set(title.split()) | set(author.split()):
+            ids = self._postings[token]
+            ids.discard(item.id)
+            if ids:
+                continue
+            del self._postings[token]
+            for gram in _trigrams(token):
+                tokens = self._trigrams[gram]
+                tokens.discard(token)
+                if not tokens:
+                    del self._trigrams[gram]
+            for gram in word_bigrams(token):
+                tokens = self._bigrams[(len(token), gram)]
+                tokens.discard(token)
+                if not tokens:
+                    del self._bigrams[(len(token), gram)]
+
+    def search(self, q):
+        """Returns the indexed items whose title or author contains `q` (already lowercased), by id."""
+        pieces = sorted(set(q.split()), key=len, reverse=True)
+        if not pieces:
+            return [doc[0] for doc in self._docs.values()]
+
+        # Every whitespace-free piece of q must lie inside a single token of a match,
+        # so intersecting per-piece candidates (longest, most selective first) is safe.
+        candidates = None
+        for piece in pieces:
+            ids = set()
+            for token in self._tokens_containing(piece):
+                ids |= self._postings[token]
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+
+        matches = (self._docs[item_id] for item_id in sorted(candidates))
+        if len(pieces) == 1 and pieces[0] == q:
+            return [doc[0] for doc in matches]
+        # Multi-word queries must still match contiguously within one field.
+        return [item for item, title, author in matches if q in title or q in author]
+
+    def fuzzy_search(self, q):
+        """
+        Scores items against the words of `q` (lowercased), each allowed
+        typo_limit(word) typos. Returns {item id: score}, the score summing
+        each query word's similarity to its best match among the item's words.
+        Only indexed words sharing enough bigrams with a query word are
+        compared with it, and only items containing those words are scored.
+        """
+        scores = {}
+        for word in set(q.split()):
+            best = {}
+            for token, similarity in self._similar_tokens(word):
+                for item_id in self._postings[token]:
+                    if best.get(item_id, 0) < similarity:
+                        best[item_id] = similarity
+            for item_id, similarity in best.items():
+                scores[item_id] = scores.get(item_id, 0) + similarity
+        return scores
+
+    def _similar_tokens(self, word):
+        """(token, similarity) for the indexed tokens within typo_limit(word) edits of `word`."""
+        if not typo_limit(word):
+            return [(word, 1.0)] if word in self._postings else []
+        grams, shortest, longest, needed = typo_bounds(word)
+        shared = Counter()
+        for length in range(shortest, longest + 1):
+            for gram in grams:
+                tokens = self._bigrams.get((length, gram))
+                if tokens:
+                    shared.update(tokens)
+        return similar_words(word, [token for token, count in shared.most_common(FUZZY_MAX_TOKENS) if count >= needed])
+
+    def _tokens_containing(self, piece):
+        if len(piece) < 3:
+            return [token for token in self._postings if piece in token]
+        gram_sets = []
+        for gram in _trigrams(piece):
+            tokens = self._trigrams.get(gram)
+            if tokens is None:
+                return []
+            gram_sets.append(tokens)
+        gram_sets.sort(key=len)
+        tokens = set(gram_sets[0])
+        for gram_set in gram_sets[1:]:
+            tokens &= gram_set
+            if not tokens:
+                return []
+        return [token for token in tokens if piece in token]
+
+
+class SortedIndex:
+    """
+    Keeps items ordered by one of SORT_FIELDS, ties broken by id, so GET /items
+    can walk a pre-ordered sequence. Inserts and removals locate their slot by
+    bisection instead of re-sorting.
+    """
+    def __init__(self, field, items=()):
+        if field not in SORT_FIELDS:
+            raise ValueError(f"unsupported sort field: {field}")
+        self.field = field
+        self.key = _SORT_KEYS[field]
+        # Bulk loads sort once rather than inserting item by item.
+        self._items = sorted(items, key=self.key)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __reversed__(self):
+        return reversed(self._items)
+
+    def iter_after(self, key=None, descending=False):
+        """
+        Yields items in index order starting strictly after sort key `key` (from
+        a previous page), or from the beginning when `key` is None.
+        """
+        items = self._items
+        if descending:
+            i = len(items) if key is None else bisect.bisect_left(items, key, key=self.key)
+            while i > 0:
+                i -= 1
+                if i < len(items):
+                    yield items[i]
+        else:
+            i = 0 if key is None else bisect.bisect_right(items, key, key=self.key)
+            while i < len(items):
+                yield items[i]
+                i += 1
+
+    def add(self, item):
+        bisect.insort(self._items, item, key=self.key)
+
+    def remove(self, item):
+        """Removes `item`; its sort field must not have changed since it was added."""
+        key = self.key(item)
+        i = bisect.bisect_left(self._items, key, key=self.key)
+        if i < len(self._items) and self._items[i].id == item.id:
+            del self._items[i]
+
+    def sort(self, items, descending=False):
+        """Orders an arbitrary subset of items the same way this index does."""
+        return sorted(items, key=self.key, reverse=descending)
+
+    def between(self, low, high):
+        """Returns the items whose sort keys are >= `low` and < `high`, in index order."""
+        return self._items[self._position(low):self._position(high)]
+
+    def count_between(self, low, high):
+        """len(between(low, high)), by bisection alone."""
+        return max(0, self._position(high) - self._position(low))
+
+    def _position(self, key):
+        return bisect.bisect_left(self._items, key, key=self.key)
+
+
+class HashIndex:
+    """Maps each value of one item field to the items holding exactly that value."""
+    def __init__(self, field, items=()):
+        self.field = field
+        self._items = {}  # value -> {id: item}
+        for item in items:
+            self.add(item)
+
+    def get(self, value):
+        """The items whose field equals `value`, as an id -> item mapping (do not modify)."""
+        return self._items.get(value, {})
+
+    def add(self, item):
+        self._items.setdefault(getattr(item, self.field), {})[item.id] = item
+
+    def remove(self, item):
+        """Drops `item`; its field must not have changed since it was added."""
+        value = getattr(item, self.field)
+        items = self._items.get(value)
+        if items is not None and items.pop(item.id, None) is not None and not items:
+            del self._items[value]
+
+
+class FacetIndex:
+    """
+    Counts items by type, year bucket and author, kept per item type and
+    updated as items are added and removed, so facet counts for the whole
+    catalog or for a type filter never look at the items themselves.
+    """
+    def __init__(self, items=()):
+        self._counts = {}  # item type -> Counter of (facet, value)
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        counts = self._counts.get(item.type)
+        if counts is None:
+            counts = self._counts[item.type] = Counter()
+        counts.update(facet_values(item))
+
+    def remove(self, item):
+        """Uncounts `item`, which must have been added with the same field values."""
+        counts = self._counts[item.type]
+        for key in facet_values(item):
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+
+    def counts(self, types=None):
+        """Returns {facet: Counter(value -> item count)} over the given item types, or over all of them."""
+        if types is None:
+            selected = self._counts.values()
+        else:
+            selected = [self._counts[type_] for type_ in types if type_ in self._counts]
+        result = {facet: Counter() for facet in FACETS}
+        for counts in selected:
+            for (facet, value), count in counts.items():
+                result[facet][value] += count
+        return result
+
+
+def facet_values(item):
+    """The (facet, value) pairs `item` is counted under; the year is its decade, or None."""
+    year = item.year
+    bucket = year - year % YEAR_BUCKET if isinstance(year, int) else None
+    return (('type', item.type), ('year', bucket), ('author', item.author or ''))
+
+
+def count_facets(items):
+    """Facet counts shaped like FacetIndex.counts(), for an arbitrary collection of items."""
+    result = {facet: Counter() for facet in FACETS}
+    for item in items:
+        for facet, value in facet_values(item):
+            result[facet][value] += 1
+    return result
+
+
+def typo_limit(word):
+    """Edits fuzzy search tolerates in a query word: none for short words, more for long ones."""
+    if len(word) <= 2:
+        return 0
+    return 1 if len(word) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """
+    Edit distance between `a` and `b` counting insertions, deletions,
+    substitutions and swaps of adjacent characters; limit + 1 once it is
+    certain to exceed `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            distance = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, before[j - 2] + 1)
+            row[j] = distance
+        if min(row) > limit:
+            return limit + 1
+        before, previous = previous, row
+    return min(previous[-1], limit + 1)
+
+
+def word_similarity(word, token, distance):
+    """1.0 for an exact match, less the larger the share of `token` that had to be edited."""
+    return 1 - distance / max(len(word), len(token))
+
+
+def typo_bounds(word):
+    """
+    What any word within typo_limit(word) (at least one) edits of `word`
+    shares with it: (the bigrams of `word`, the shortest and longest such
+    word's length, the fewest of those bigrams it contains).
+    """
+    limit = typo_limit(word)
+    grams = word_bigrams(word)
+    # An edit changes at most three bigrams.
+    return grams, len(word) - limit, len(word) + limit, max(1, len(grams) - 3 * limit)
+
+
+def similar_words(word, tokens):
+    """(token, similarity) for those of `tokens` within typo_limit(word) edits of `word`."""
+    limit = typo_limit(word)
+    similar = []
+    for token in tokens:
+        distance = edit_distance(word, token, limit)
+        if distance <= limit:
+            similar.append((token, word_similarity(word, token, distance)))
+    return similar
+
+
+def year_bounds(year_min=None, year_max=None):
+    """
+    The year index keys bounding years year_min..year_max (inclusive; None
+    leaves that side open), for SortedIndex.between(). Items without an
+    integer year fall outside any range.
+    """
+    low = (1,) if year_min is None else (1, year_min)
+    high = (2,) if year_max is None else (1, year_max + 1)
+    return low, high
+
+
+def _year_key(item):
+    # Missing or malformed years sort before every real year.
+    year = item.year
+    if isinstance(year, int):
+        return (1, year, item.id)
+    return (0, 0, item.id)
+
+
+_SORT_KEYS = {
+    'title': lambda item: (item.title or '', item.id),
+    'year': _year_key,
+    'author': lambda item: (item.author or '', item.id),
+    'id': lambda item: (item.id,),
+}
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def word_bigrams(token):
+    """The bigrams of `token` padded with '^' and '$', which fuzzy search compares words by."""
+    padded = f'^{token}$'
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
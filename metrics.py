@@ -0,0 +1,255 @@
+# metrics.py - counters, timings and a slow-request profiler, served as Prometheus text
+import collections
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the timing histogram buckets.
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    """A named family of values, one per combination of label values."""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def labels(self, *values):
+        """Returns the child for these label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        # labels() may add children from request threads meanwhile.
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """A total that only goes up (requests served, bytes written, fsyncs...)."""
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{self._label_text(values)} {child.value}']
+
+
+class _HistogramChild:
+    __slots__ = ('counts', 'sum', '_lock')
+
+    def __init__(self, bucket_count):
+        self.counts = [0] * bucket_count
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value, buckets=TIME_BUCKETS):
+        # One slot per bucket plus +Inf; rendering turns them into cumulative counts.
+        position = bisect_left(buckets, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """Durations (in seconds) counted into TIME_BUCKETS, with their count and sum."""
+    type = 'histogram'
+
+    def _new_child(self):
+        return _HistogramChild(len(TIME_BUCKETS) + 1)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        total = 0
+        for bound, count in zip(TIME_BUCKETS + (float('inf'),), child.counts):
+            total += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{self.name}_bucket{self._label_text(values, [("le", le)])} {total}')
+        lines.append(f'{self.name}_sum{self._label_text(values)} {child.sum}')
+        lines.append(f'{self.name}_count{self._label_text(values)} {total}')
+        return lines
+
+
+class Callback(_Metric):
+    """A value read from elsewhere (e.g. a cache's hit count) each time metrics are rendered."""
+    def __init__(self, name, documentation, metric_type, read):
+        super().__init__(name, documentation)
+        self.type = metric_type
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}',
+                f'{self.name} {value}']
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Metrics shared by the backend, the catalogs and storage ---
+
+PHASE_SECONDS = Histogram(
+    'library_phase_seconds', 'Time spent in each phase of an operation.', ('operation', 'phase'))
+QUERY_PLANS = Counter(
+    'library_query_plans_total', 'Item queries by how they were answered (which index, or a scan).', ('plan',))
+PERSISTENCE_BYTES = Counter(
+    'library_persistence_bytes_total', 'Bytes written to the log and to snapshots.', ('kind',))
+PERSISTENCE_FSYNCS = Counter(
+    'library_persistence_fsyncs_total', 'fsync() calls on the log, snapshots and their directory.', ('kind',))
+FSYNC_SECONDS = Histogram(
+    'library_fsync_seconds', 'Time spent in fsync().', ('kind',))
+LOG_FLUSHES = Counter(
+    'library_log_flushes_total', 'Background writes of buffered log records (write-behind durability).')
+
+
+class PhaseTimer:
+    """
+    Times the consecutive phases of one operation: each mark(phase) records
+    the time since the previous mark (or since the timer was created).
+    """
+    __slots__ = ('operation', '_last')
+
+    def __init__(self, operation):
+        self.operation = operation
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        PHASE_SECONDS.labels(self.operation, phase).observe(now - self._last)
+        self._last = now
+
+
+def fsync(fd, kind):
+    """os.fsync(fd), counted and timed under `kind` ('log', 'snapshot' or 'dir')."""
+    start = time.perf_counter()
+    os.fsync(fd)
+    FSYNC_SECONDS.labels(kind).observe(time.perf_counter() - start)
+    PERSISTENCE_FSYNCS.labels(kind).inc()
+
+
+# --- Slow request profiler ---
+
+class SlowRequestProfiler:
+    """
+    Opt-in sampling profiler for slow requests. A background thread looks at
+    the stacks of requests that have been running for over half of
+    `threshold` seconds, every `interval` seconds; when a request finishes
+    after more than `threshold` seconds, its most frequent stacks are
+    reported. Fast requests are never sampled, so they only pay for
+    start() and finish().
+    """
+    def __init__(self, threshold, interval=0.005, report=print, top=5, depth=12):
+        self.threshold = threshold
+        self.interval = interval
+        self.report = report
+        self.top = top
+        self.depth = depth
+        self._active = {}  # thread id -> [label, start time, Counter of stacks]
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._sample_forever, daemon=True)
+        self._thread.start()
+
+    def start(self, label):
+        entry = [label, time.perf_counter(), collections.Counter()]
+        with self._lock:
+            self._active[threading.get_ident()] = entry
+
+    def finish(self):
+        """Ends the current thread's request; reports it if it was slow. Returns its duration."""
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+        if entry is None:
+            return None
+        label, started, stacks = entry
+        elapsed = time.perf_counter() - started
+        if elapsed >= self.threshold:
+            self.report(self._format(label, elapsed, stacks))
+        return elapsed
+
+    def _sample_forever(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                slow = [(ident, entry) for ident, entry in self._active.items()
+                        if now - entry[1] >= self.threshold / 2]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for ident, entry in slow:
+                frame = frames.get(ident)
+                if frame is not None:
+                    entry[2][self._stack(frame)] += 1
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.depth:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}')
+            frame = frame.f_back
+        return tuple(stack)
+
+    def _format(self, label, elapsed, stacks):
+        total = sum(stacks.values())
+        lines = [f"SLOW REQUEST: {label} took {elapsed * 1000:.0f} ms ({total} samples)"]
+        for stack, count in stacks.most_common(self.top):
+            lines.append(f"  {count / total:6.1%}  " + ' <- '.join(stack))
+        return '\n'.join(lines)
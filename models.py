@@ -1,17 +1,39 @@
 # models.py - FINAL version for JSON persistence (NO SQLALCHEMY)
+import json
+import sys
+
+try:
+    import orjson  # optional; several times faster than the json module
+except ImportError:
+    orjson = None
+
+ITEM_TYPES = ('book', 'magazine', 'film')
+
+# Ids and years are stored as SQLite integers, which are 64-bit.
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
 
 class Item:
     """
     Defines the structure for a media item. 
     Uses 'id' in the constructor, which fixes the TypeError.
+    Uses __slots__ (no per-instance __dict__) and interns the type and author
+    strings, which repeat across many items, to keep large catalogs compact.
+
+    Items are never changed in place: an update builds a replacement Item.
+    That lets each one keep its JSON encoding once computed (see to_json()).
     """
+    __slots__ = ('id', 'type', 'title', 'author', 'year', '_json')
+
     def __init__(self, id, type, title, author, year):
         self.id = id
-        self.type = type
+        self.type = _intern(type)
         self.title = title
-        self.author = author
+        self.author = _intern(author)
         self.year = year
-        
+        self._json = None
+
     def as_dict(self):
         """Returns the item's data as a dictionary, compatible with JSON output."""
         return {
@@ -20,4 +42,30 @@ class Item:
             "title": self.title,
             "author": self.author,
             "year": self.year
-        }
\ No newline at end of file
+        }
+
+    def to_json(self):
+        """Returns the item encoded as compact JSON bytes, encoding it only the first time."""
+        if self._json is None:
+            self._json = encode_json(self.as_dict())
+        return self._json
+
+
+def encode_json(value):
+    """Encodes `value` as compact UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the json module still handles
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def is_int64(value):
+    """True for an int (not a bool) that fits a SQLite integer."""
+    return type(value) is int and INT64_MIN <= value <= INT64_MAX
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
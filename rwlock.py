@@ -0,0 +1,45 @@
+# rwlock.py - reader/writer lock for the in-memory catalog
+import contextlib
+import threading
+
+
+class ReadWriteLock:
+    """
+    Any number of readers may hold the lock together; a writer holds it alone.
+    Waiting writers block new readers, so a steady stream of GETs cannot
+    starve POST/PATCH/DELETE. Not reentrant.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
@@ -0,0 +1,555 @@
+# sqlite_catalog.py - SQLite storage backend for the /items API (uses items.db)
+import contextlib
+import queue
+import sqlite3
+from collections import Counter
+
+import metrics
+from models import Item, is_int64
+from catalog import ItemQuery, ItemFilter, SAMPLE_ITEMS, CHANGE_LOG_SIZE
+from indexes import SORT_FIELDS, FACETS, YEAR_BUCKET, FUZZY_MAX_TOKENS, typo_limit, typo_bounds, similar_words
+
+# Idle connections kept open for reuse between requests.
+POOL_SIZE = 8
+
+
+def _year_bucket(year):
+    # Same buckets as indexes.facet_values(); '' stands for no (or a non-integer) year.
+    return (f"CASE WHEN typeof({year}) = 'integer' "
+            f"THEN {year} - (({year} % {YEAR_BUCKET}) + {YEAR_BUCKET}) % {YEAR_BUCKET} ELSE '' END")
+
+
+def _facet_keys(row):
+    # (facet, value) for the trigger row `row`. Not VALUES: its columnN names don't resolve in triggers.
+    return (f"SELECT 'type' AS facet, {row}.type AS value "
+            f"UNION ALL SELECT 'year', {_year_bucket(f'{row}.year')} "
+            f"UNION ALL SELECT 'author', IFNULL({row}.author, '')")
+
+
+def _facet_count(row):
+    return (f"INSERT INTO item_facet (type, facet, value, count) "
+            f"SELECT {row}.type, facet, value, 1 FROM ({_facet_keys(row)}) WHERE true "
+            f"ON CONFLICT DO UPDATE SET count = count + 1;")
+
+
+def _facet_rows(table):
+    # (type, facet, value, count) rows for every item in `table`.
+    return (f"SELECT type, 'type' AS facet, type AS value, COUNT(*) AS count FROM {table} GROUP BY 1 "
+            f"UNION ALL SELECT type, 'year', {_year_bucket('year')}, COUNT(*) FROM {table} GROUP BY 1, 3 "
+            f"UNION ALL SELECT type, 'author', IFNULL(author, ''), COUNT(*) FROM {table} GROUP BY 1, 3")
+
+
+def _facet_uncount(row):
+    keys = f"type = {row}.type AND (facet, value) IN ({_facet_keys(row)})"
+    return (f"UPDATE item_facet SET count = count - 1 WHERE {keys};\n"
+            f"    DELETE FROM item_facet WHERE count = 0 AND {keys};")
+
+
+def _word_rows(rows):
+    # (id, word) for each distinct word in the title and author of `rows` (a SELECT of id, title, author),
+    # split on whitespace like SearchIndex; but SQLite's lower() only folds ASCII letters.
+    text = "lower(title || ' ' || IFNULL(author, ''))"
+    for char in (9, 10, 11, 12, 13):
+        text = f"replace({text}, char({char}), ' ')"
+    return (f"WITH RECURSIVE split (id, word, rest) AS (SELECT id, '', {text} || ' ' FROM ({rows}) "
+            f"UNION ALL SELECT id, substr(rest, 1, instr(rest, ' ') - 1), substr(rest, instr(rest, ' ') + 1) "
+            f"FROM split WHERE rest != '') "
+            f"SELECT DISTINCT id, word FROM split WHERE word != ''")
+
+
+def _bigram_rows(words):
+    # (bigram, length, word) for the bigrams indexes.word_bigrams() finds in each of `words` (a SELECT of word).
+    return (f"WITH RECURSIVE gram (word, padded, i) AS (SELECT word, '^' || word || '$', 1 FROM ({words}) "
+            f"UNION ALL SELECT word, padded, i + 1 FROM gram WHERE i < length(padded) - 1) "
+            f"SELECT DISTINCT substr(padded, i, 2), length(word), word FROM gram")
+
+
+def _new_words(row):
+    # The words of the trigger row `row` no other item contains.
+    words = _word_rows(f"SELECT {row}.id AS id, {row}.title AS title, {row}.author AS author")
+    return (f"SELECT word FROM ({words}) AS row_word "
+            f"WHERE NOT EXISTS (SELECT 1 FROM item_word WHERE item_word.word = row_word.word)")
+
+
+def _word_index(row):
+    words = _word_rows(f"SELECT {row}.id AS id, {row}.title AS title, {row}.author AS author")
+    return (f"INSERT OR IGNORE INTO item_word_bigram (bigram, length, word) {_bigram_rows(_new_words(row))};\n"
+            f"    INSERT INTO item_word (word, id) SELECT word, id FROM ({words});")
+
+
+def _word_unindex(row):
+    words = _word_rows(f"SELECT {row}.id AS id, {row}.title AS title, {row}.author AS author")
+    return (f"DELETE FROM item_word WHERE (word, id) IN (SELECT word, id FROM ({words}));\n"
+            f"    DELETE FROM item_word_bigram WHERE (bigram, length, word) IN ({_bigram_rows(_new_words(row))});")
+
+
+# The `item` table matches the SQLAlchemy model in modelbackup.py.
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS item (
+    id INTEGER NOT NULL,
+    type VARCHAR(80) NOT NULL,
+    title VARCHAR(120) NOT NULL,
+    author VARCHAR(120),
+    year INTEGER,
+    PRIMARY KEY (id)
+);
+CREATE INDEX IF NOT EXISTS ix_item_type_title ON item (type, title, id);
+CREATE INDEX IF NOT EXISTS ix_item_title ON item (title, id);
+CREATE INDEX IF NOT EXISTS ix_item_author ON item (author, id);
+CREATE INDEX IF NOT EXISTS ix_item_year ON item (year, id);
+
+-- Trigram full-text index over title/author, kept in sync by triggers.
+CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5(
+    title, author, content='item', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS item_fts_insert AFTER INSERT ON item BEGIN
+    INSERT INTO item_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+CREATE TRIGGER IF NOT EXISTS item_fts_delete AFTER DELETE ON item BEGIN
+    INSERT INTO item_fts (item_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+END;
+CREATE TRIGGER IF NOT EXISTS item_fts_update AFTER UPDATE ON item BEGIN
+    INSERT INTO item_fts (item_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    INSERT INTO item_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+
+-- Next id to hand out. `item` has no AUTOINCREMENT, so SQLite alone would
+-- reuse the id of a deleted newest row.
+CREATE TABLE IF NOT EXISTS item_seq (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    next_id INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO item_seq (id, next_id) VALUES (1, (SELECT IFNULL(MAX(id), 0) + 1 FROM item));
+
+-- Change counter for HTTP caching and the change feed, bumped by every write to `item`,
+-- and a random epoch telling this database's versions from those of any it replaced.
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    epoch INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (id, version, epoch) VALUES (1, 0, random() & 9223372036854775807);
+
+-- The most recent changes, numbered by the version they produced (the change feed).
+CREATE TABLE IF NOT EXISTS item_change (
+    seq INTEGER PRIMARY KEY,
+    op TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    type VARCHAR(80),
+    title VARCHAR(120),
+    author VARCHAR(120),
+    year INTEGER
+);
+CREATE TRIGGER IF NOT EXISTS item_change_insert AFTER INSERT ON item BEGIN
+    UPDATE catalog_meta SET version = version + 1;
+    INSERT INTO item_change (seq, op, id, type, title, author, year)
+        SELECT version, 'create', new.id, new.type, new.title, new.author, new.year FROM catalog_meta;
+    DELETE FROM item_change WHERE seq <= (SELECT version FROM catalog_meta) - {CHANGE_LOG_SIZE};
+END;
+CREATE TRIGGER IF NOT EXISTS item_change_update AFTER UPDATE ON item BEGIN
+    UPDATE catalog_meta SET version = version + 1;
+    INSERT INTO item_change (seq, op, id, type, title, author, year)
+        SELECT version, 'update', new.id, new.type, new.title, new.author, new.year FROM catalog_meta;
+    DELETE FROM item_change WHERE seq <= (SELECT version FROM catalog_meta) - {CHANGE_LOG_SIZE};
+END;
+CREATE TRIGGER IF NOT EXISTS item_change_delete AFTER DELETE ON item BEGIN
+    UPDATE catalog_meta SET version = version + 1;
+    INSERT INTO item_change (seq, op, id) SELECT version, 'delete', old.id FROM catalog_meta;
+    DELETE FROM item_change WHERE seq <= (SELECT version FROM catalog_meta) - {CHANGE_LOG_SIZE};
+END;
+
+-- Item counts per type by facet ('type', 'year' decade, 'author'), kept up to
+-- date by triggers so GET /items/facets without `q` never scans `item`.
+CREATE TABLE IF NOT EXISTS item_facet (
+    type VARCHAR(80) NOT NULL,
+    facet TEXT NOT NULL,
+    value NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (type, facet, value)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS item_facet_insert AFTER INSERT ON item BEGIN
+    {_facet_count('new')}
+END;
+CREATE TRIGGER IF NOT EXISTS item_facet_delete AFTER DELETE ON item BEGIN
+    {_facet_uncount('old')}
+END;
+CREATE TRIGGER IF NOT EXISTS item_facet_update AFTER UPDATE OF type, author, year ON item BEGIN
+    {_facet_uncount('old')}
+    {_facet_count('new')}
+END;
+
+-- The words of each item's title and author, and the bigrams of every word
+-- any item contains, kept up to date by triggers for fuzzy search: it looks
+-- up words resembling the query's (see SearchIndex), then the items containing them.
+CREATE TABLE IF NOT EXISTS item_word (
+    word TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (word, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS item_word_bigram (
+    bigram TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    PRIMARY KEY (bigram, length, word)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS item_word_insert AFTER INSERT ON item BEGIN
+    {_word_index('new')}
+END;
+CREATE TRIGGER IF NOT EXISTS item_word_delete AFTER DELETE ON item BEGIN
+    {_word_unindex('old')}
+END;
+CREATE TRIGGER IF NOT EXISTS item_word_update AFTER UPDATE OF title, author ON item BEGIN
+    {_word_unindex('old')}
+    {_word_index('new')}
+END;
+"""
+
+COLUMNS = 'id, type, title, author, year'
+
+
+def _contains_q(title, author, q):
+    # Same test as the in-memory search: Python's lower(), not SQLite's ASCII-only one.
+    return (q in (title or '').lower()) or (q in (author or '').lower())
+
+
+class SQLiteCatalog:
+    """
+    Serves the catalog straight from SQLite (WAL mode) so it never has to be
+    loaded into process memory. Sorting and keyset pagination use the column
+    indexes; `q` narrows candidates through the FTS5 trigram table.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._pool = queue.LifoQueue()
+        self._epoch = None
+
+    # --- Connections ---
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.create_function('contains_q', 3, _contains_q, deterministic=True)
+        return conn
+
+    @contextlib.contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if self._pool.qsize() < POOL_SIZE:
+                self._pool.put(conn)
+            else:
+                conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    # --- Loading and persistence ---
+
+    def load(self):
+        """Creates the schema and indexes if needed; seeds the samples into a new database."""
+        with self._transaction() as conn:
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            # executescript() would commit mid-transaction, so run statement by statement.
+            for statement in _statements(SCHEMA):
+                conn.execute(statement)
+            if 'item' not in existing:
+                print(f"Creating initial database: {self.path}")
+                conn.executemany('INSERT INTO item (id, type, title, author, year) VALUES (?, ?, ?, ?, ?)',
+                                 [(i.id, i.type, i.title, i.author, i.year) for i in SAMPLE_ITEMS])
+                # item_seq was seeded from the still empty table.
+                conn.execute('UPDATE item_seq SET next_id = (SELECT MAX(id) FROM item) + 1')
+            else:
+                if 'item_fts' not in existing:
+                    # Index rows written before the full-text table existed.
+                    conn.execute("INSERT INTO item_fts (item_fts) VALUES ('rebuild')")
+                if 'item_facet' not in existing:
+                    # Count rows written before the facet table existed.
+                    conn.execute(f"INSERT INTO item_facet (type, facet, value, count) {_facet_rows('item')}")
+                if 'item_word' not in existing:
+                    # Index the words of rows written before the word tables existed.
+                    conn.execute(f"INSERT INTO item_word (word, id) SELECT word, id FROM "
+                                 f"({_word_rows('SELECT id, title, author FROM item')})")
+                    conn.execute(f"INSERT INTO item_word_bigram (bigram, length, word) "
+                                 f"{_bigram_rows('SELECT DISTINCT word FROM item_word')}")
+                if 'sqlite_stat1' not in existing or not conn.execute(
+                        "SELECT 1 FROM sqlite_stat1 WHERE tbl = 'item'").fetchone():
+                    # Index statistics let SQLite's planner start from the most selective
+                    # index (author, year or type); sampled, so quick even for large tables.
+                    conn.execute('PRAGMA analysis_limit = 1000')
+                    conn.execute('ANALYZE item')
+
+    @property
+    def epoch(self):
+        """Random, fixed when the database was created; part of the ETag."""
+        if self._epoch is None:
+            with self._connection() as conn:
+                self._epoch = conn.execute('SELECT epoch FROM catalog_meta').fetchone()[0]
+        return self._epoch
+
+    @property
+    def version(self):
+        """Number of item rows ever written; increases with every create/update/delete."""
+        with self._connection() as conn:
+            return conn.execute('SELECT version FROM catalog_meta').fetchone()[0]
+
+    def save(self):
+        """Every write is already committed; nothing to do."""
+
+    def close(self):
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            # Refreshes the planner's statistics where they have gone stale.
+            conn.execute('PRAGMA optimize')
+            conn.close()
+
+    # --- Reads ---
+
+    def get(self, item_id):
+        if not is_int64(item_id):
+            return None
+        with self._connection() as conn:
+            row = conn.execute(f'SELECT {COLUMNS} FROM item WHERE id = ?', (item_id,)).fetchone()
+        return Item(*row) if row else None
+
+    def changes(self, since, limit=None):
+        """
+        Returns up to `limit` (seq, op, Item or id) changes made after version
+        `since`, oldest first, or None if some of them are no longer kept.
+        """
+        with self._connection() as conn:
+            version, first = conn.execute(
+                'SELECT version, (SELECT MIN(seq) FROM item_change) FROM catalog_meta').fetchone()
+            floor = version if first is None else first - 1
+            if since < floor or since > version:
+                return None
+            rows = conn.execute('SELECT seq, op, id, type, title, author, year FROM item_change '
+                                'WHERE seq > ? ORDER BY seq LIMIT ?', (since, -1 if limit is None else limit))
+            return [(seq, op, item_id if op == 'delete' else Item(item_id, *fields))
+                    for seq, op, item_id, *fields in rows]
+
+    def facets(self, q='', type_filter=None, author=None, year_min=None, year_max=None):
+        """Returns {facet: Counter(value -> item count)} over the items matching the filters (see query())."""
+        filters = ItemFilter(q, type_filter, author, year_min, year_max)
+        if filters.q or filters.author is not None or filters.has_years:
+            # Counted from the matching rows; the summary table is only kept per type.
+            where, params = _filters(filters)
+            sql = (f"WITH matching AS MATERIALIZED (SELECT type, author, year FROM item WHERE {' AND '.join(where)}) "
+                   f"SELECT facet, value, SUM(count) FROM ({_facet_rows('matching')}) GROUP BY 1, 2")
+            metrics.QUERY_PLANS.labels('facets_filtered').inc()
+        else:
+            where, params = _filters(filters)
+            sql = 'SELECT facet, value, SUM(count) FROM item_facet'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += ' GROUP BY facet, value'
+            metrics.QUERY_PLANS.labels('facets_summary').inc()
+        result = {facet: Counter() for facet in FACETS}
+        with self._connection() as conn:
+            for facet, value, count in conn.execute(sql, params):
+                result[facet][None if facet == 'year' and value == '' else value] = count
+        return result
+
+    def query(self, q='', type_filter=None, sort='title', descending=False,
+              author=None, year_min=None, year_max=None):
+        """
+        Returns an ItemQuery over the items matching `q` (lowercased),
+        `type_filter` (one type or several), `author` exactly and the years
+        year_min..year_max. SQLite's own planner picks the column index to
+        start from; explain() reports its choice.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"unsupported sort field: {sort}")
+        where, params = _filters(ItemFilter(q, type_filter, author, year_min, year_max))
+
+        metrics.QUERY_PLANS.labels('sqlite_fts' if len(q) >= 3 else 'sqlite_scan' if q else 'sqlite_index').inc()
+        direction = 'DESC' if descending else 'ASC'
+        if sort == 'id':
+            order_by = f'id {direction}'
+            key = lambda item: (item.id,)
+        else:
+            order_by = f'{sort} {direction}, id {direction}'
+            key = lambda item: (getattr(item, sort), item.id)
+
+        def select(after, count):
+            clauses = list(where)
+            args = list(params)
+            if after is not None:
+                clause, after_args = _keyset_clause(sort, after, descending)
+                clauses.append(clause)
+                args.extend(after_args)
+            sql = f'SELECT {COLUMNS} FROM item'
+            if clauses:
+                sql += ' WHERE ' + ' AND '.join(f'({c})' for c in clauses)
+            sql += f' ORDER BY {order_by} LIMIT ?'
+            args.append(-1 if count is None else count)
+            return sql, args
+
+        def fetch(after, count):
+            sql, args = select(after, count)
+            with self._connection() as conn:
+                return [Item(*row) for row in conn.execute(sql, args)]
+
+        def explain():
+            sql, args = select(None, None)
+            with self._connection() as conn:
+                return '; '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, args))
+
+        return ItemQuery(fetch, key, explain)
+
+    def fuzzy_search(self, q, limit, type_filter=None, author=None, year_min=None, year_max=None):
+        """
+        Returns up to `limit` items matching the words of `q` (lowercased) with
+        typos tolerated, most relevant first; the other filters are as in
+        query(). Scored like the JSON backend, from the words in item_word
+        resembling the query's, so only items containing one are ever read.
+        """
+        metrics.QUERY_PLANS.labels('fuzzy').inc()
+        with self._connection() as conn:
+            similar = []  # (query word number, word, similarity)
+            for number, word in enumerate(sorted(set(q.split()))):
+                similar += [(number, token, similarity) for token, similarity in _similar_words(conn, word)]
+            if not similar:
+                return []
+            # Per item, each query word counts with its best match among the item's words.
+            sql = (f"WITH similar (word_no, word, similarity) AS (VALUES {', '.join(['(?, ?, ?)'] * len(similar))}), "
+                   f"best AS (SELECT id, MAX(similarity) AS similarity FROM similar JOIN item_word USING (word) "
+                   f"GROUP BY id, word_no), "
+                   f"score AS (SELECT id, SUM(similarity) AS score FROM best GROUP BY id) "
+                   f"SELECT {COLUMNS} FROM score JOIN item USING (id)")
+            params = [value for row in similar for value in row]
+            where, filter_params = _filters(ItemFilter('', type_filter, author, year_min, year_max))
+            if where:
+                sql += ' WHERE ' + ' AND '.join(f'({c})' for c in where)
+            sql += ' ORDER BY score DESC, title, id LIMIT ?'
+            return [Item(*row) for row in conn.execute(sql, params + filter_params + [limit])]
+
+    # --- Writes ---
+
+    def create(self, fields):
+        return self.create_many([fields])[0]
+
+    def create_many(self, rows):
+        """Inserts an item per validated field dict in a single transaction."""
+        created = []
+        with self._transaction() as conn:
+            # Rows inserted by other tools may have run past the counter.
+            next_id = conn.execute('SELECT MAX(next_id, IFNULL((SELECT MAX(id) FROM item), 0) + 1) '
+                                   'FROM item_seq').fetchone()[0]
+            for fields in rows:
+                created.append(Item(id=next_id, **fields))
+                next_id += 1
+            conn.executemany('INSERT INTO item (id, type, title, author, year) VALUES (?, ?, ?, ?, ?)',
+                             [(i.id, i.type, i.title, i.author, i.year) for i in created])
+            conn.execute('UPDATE item_seq SET next_id = ?', (next_id,))
+        return created
+
+    def update(self, item_id, fields):
+        if not is_int64(item_id):
+            return None
+        with self._transaction() as conn:
+            row = conn.execute(f'SELECT {COLUMNS} FROM item WHERE id = ?', (item_id,)).fetchone()
+            if row is None:
+                return None
+            updated = Item(**dict(Item(*row).as_dict(), **fields))
+            conn.execute('UPDATE item SET type = ?, title = ?, author = ?, year = ? WHERE id = ?',
+                         (updated.type, updated.title, updated.author, updated.year, item_id))
+        return updated
+
+    def delete(self, item_id):
+        if not is_int64(item_id):
+            return False
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM item WHERE id = ?', (item_id,)).rowcount > 0
+
+
+def _filters(filters):
+    """WHERE clauses (and their arguments) selecting the rows matching an ItemFilter."""
+    where = []
+    params = []
+    q = filters.q
+    if filters.types:
+        where.append(f"type IN ({', '.join('?' * len(filters.types))})")
+        params.extend(sorted(filters.types))
+    if filters.author is not None:
+        where.append('author = ?')
+        params.append(filters.author)
+    if filters.has_years:
+        # Integer years only, as in the JSON backend (SQLite sorts text after numbers).
+        where.append("typeof(year) = 'integer'")
+        if filters.year_min is not None:
+            where.append('year >= ?')
+            params.append(filters.year_min)
+        if filters.year_max is not None:
+            where.append('year <= ?')
+            params.append(filters.year_max)
+    if q:
+        if len(q) >= 3:
+            # Trigrams can only narrow queries of three or more characters.
+            where.append('id IN (SELECT rowid FROM item_fts WHERE item_fts MATCH ?)')
+            params.append('"' + q.replace('"', '""') + '"')
+        where.append('contains_q(title, author, ?)')
+        params.append(q)
+    return where, params
+
+
+def _similar_words(conn, word):
+    """(word, similarity) for the words in item_word within typo_limit(word) edits of `word`, like SearchIndex."""
+    if not typo_limit(word):
+        found = conn.execute('SELECT 1 FROM item_word WHERE word = ?', (word,)).fetchone()
+        return [(word, 1.0)] if found else []
+    grams, shortest, longest, needed = typo_bounds(word)
+    rows = conn.execute(f"SELECT word FROM item_word_bigram "
+                        f"WHERE bigram IN ({', '.join('?' * len(grams))}) AND length BETWEEN ? AND ? "
+                        f"GROUP BY word HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC LIMIT ?",
+                        [*sorted(grams), shortest, longest, needed, FUZZY_MAX_TOKENS])
+    return similar_words(word, [token for token, in rows])
+
+
+def _keyset_clause(sort, after, descending):
+    """SQL (and arguments) selecting rows that sort strictly after the key `after`."""
+    # Anything else could not be bound (or compared) as a column value.
+    if sort == 'id':
+        (after_id,) = after
+        if not is_int64(after_id):
+            raise ValueError('malformed sort key')
+        return ('id < ?' if descending else 'id > ?'), [after_id]
+    value, after_id = after
+    if not is_int64(after_id) or not (value is None or isinstance(value, str) or is_int64(value)):
+        raise ValueError('malformed sort key')
+    # SQLite puts NULLs first in ascending order (and last in descending).
+    if value is None:
+        if descending:
+            return f'{sort} IS NULL AND id < ?', [after_id]
+        return f'({sort} IS NULL AND id > ?) OR {sort} IS NOT NULL', [after_id]
+    if descending:
+        return f'({sort}, id) < (?, ?) OR {sort} IS NULL', [value, after_id]
+    return f'({sort}, id) > (?, ?)', [value, after_id]
+
+
+def _statements(script):
+    """Splits a schema script into statements, keeping trigger bodies whole."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        if line.startswith('--'):
+            continue
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
@@ -0,0 +1,770 @@
+# storage.py - append-only persistence for the JSON catalog
+import contextlib
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock(), so only a single worker process is supported
+    fcntl = None
+
+# Rotate the log into a fresh snapshot once it holds this many records.
+COMPACT_THRESHOLD = 5000
+
+# When appended records reach the disk (see WriteAheadLog):
+#   'sync'      written by each append, fsynced before it returns (appenders share fsyncs)
+#   'flush'     buffered; a background thread writes and fsyncs every flush interval,
+#               and appends return once the flush covering them is done
+#   'immediate' buffered like 'flush', but appends return at once: a crash loses
+#               at most the last flush interval of changes
+DURABILITY_MODES = ('sync', 'flush', 'immediate')
+FLUSH_INTERVAL = 0.01
+
+# Layout of the shared version file: records ever appended, current log generation.
+VERSION_FORMAT = '<QQ'
+# ...followed by the epoch: random, chosen anew whenever the first worker starts.
+EPOCH_FORMAT = '<Q'
+
+# Item fields, in the order snapshots and make_item() callbacks use them.
+ITEM_FIELDS = ('id', 'type', 'title', 'author', 'year')
+
+# Binary snapshot layout: a header, then one fixed-size record per item, then a
+# JSON array holding each distinct string (and any other non-integer value) once.
+# Records refer to values by their position in that table; position 0 is null.
+BINARY_MAGIC = b'LIBSNAP1'
+BINARY_HEADER = struct.Struct('<8sQQ')    # magic, record count, table length in bytes
+BINARY_RECORD = struct.Struct('<qIIIBq')  # id, type, title, author, year kind, year
+YEAR_INT, YEAR_VALUE = 0, 1               # year is an int64 / a table position
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_NUMBER_CHARS = frozenset('0123456789+-.eE')
+_JSON_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+
+def binary_snapshot_path(path):
+    """Where the binary snapshot for the JSON snapshot `path` lives (library_data.bin)."""
+    return os.path.splitext(path)[0] + '.bin'
+
+
+def write_snapshot(path, items, snapshot_format='json'):
+    """
+    Atomically replaces the snapshot for `path` with `items` (objects exposing
+    as_dict()), as a JSON array or, with snapshot_format='binary', in the binary
+    layout at binary_snapshot_path(path).
+    """
+    if snapshot_format == 'binary':
+        target = binary_snapshot_path(path)
+        os.replace(_write_temp_binary_snapshot(target, items), target)
+    else:
+        target = path
+        os.replace(_write_temp_snapshot(target, items), target)
+    _fsync_dir(target)
+
+
+def read_snapshot(path, make_item):
+    """
+    Yields make_item(id, type, title, author, year) per item in the snapshot file
+    `path`, JSON or binary (told apart by the binary magic), one at a time.
+    """
+    with open(path, 'rb') as f:
+        binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    if binary:
+        yield from _read_binary_snapshot(path, make_item)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for d in iter_json_array(f):
+            yield make_item(d.get('id'), d.get('type'), d.get('title'), d.get('author'), d.get('year'))
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """
+    Yields the elements of the JSON array in text file `f` one by one, reading it
+    in chunks, so the whole document is never parsed (or held) at once.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    at_eof = False
+
+    def refill():
+        nonlocal buffer, pos, at_eof
+        chunk = f.read(chunk_size)
+        at_eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        # Skips whitespace, refilling the buffer as needed; returns '' at the end of the file.
+        nonlocal pos
+        while True:
+            pos = _JSON_WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or at_eof:
+                return buffer[pos:pos + 1]
+            refill()
+
+    if next_char() != '[':
+        raise ValueError('expected a JSON array')
+    pos += 1
+    char = next_char()
+    while char != ']':
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A number cut off by the end of the buffer may continue in the next chunk.
+                if at_eof or (end < len(buffer) and buffer[end] not in _JSON_NUMBER_CHARS):
+                    break
+            except ValueError:
+                if at_eof:
+                    raise
+            refill()
+        pos = end
+        yield value
+
+        # Fast path: the separator and the start of the next element are already buffered.
+        match = _JSON_SEPARATOR.match(buffer, pos)
+        if match is not None and match.end() < len(buffer):
+            char = match.group(1)
+            pos = match.end() if char == ',' else match.start(1)
+            continue
+        char = next_char()
+        if char == ',':
+            pos += 1
+            next_char()
+        elif char != ']':
+            raise ValueError(f'expected "," or "]" in JSON array, got {char!r}')
+    pos += 1
+    if next_char():
+        raise ValueError('extra data after JSON array')
+
+
+def _read_binary_snapshot(path, make_item):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, count, table_length = BINARY_HEADER.unpack_from(data)
+        start = BINARY_HEADER.size
+        end = start + count * BINARY_RECORD.size
+        values = json.loads(data[end:end + table_length])
+        records = memoryview(data)[start:end]
+        try:
+            for item_id, type_, title, author, year_kind, year in BINARY_RECORD.iter_unpack(records):
+                if year_kind != YEAR_INT:
+                    year = values[year]
+                yield make_item(item_id, values[type_], values[title], values[author], year)
+        finally:
+            records.release()
+
+
+def _temp_path(path):
+    # One temp file per process and thread, so neither concurrent workers nor a
+    # save() racing this process's background compaction ever share one.
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _write_temp_binary_snapshot(path, items):
+    tmp_path = _temp_path(path)
+    values = [None]
+    positions = {}
+
+    def position(value):
+        if value is None:
+            return 0
+        # Strings are keyed as themselves, anything else by its JSON text (lists are unhashable).
+        key = value if type(value) is str else (json.dumps(value, sort_keys=True),)
+        found = positions.get(key)
+        if found is None:
+            found = positions[key] = len(values)
+            values.append(value)
+        return found
+
+    records = bytearray()
+    for item in items:
+        year = item.year
+        if type(year) is int and -2 ** 63 <= year < 2 ** 63:
+            year_kind = YEAR_INT
+        else:
+            year_kind, year = YEAR_VALUE, position(year)
+        records += BINARY_RECORD.pack(item.id, position(item.type), position(item.title),
+                                      position(item.author), year_kind, year)
+    table = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode()
+    with open(tmp_path, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, len(records) // BINARY_RECORD.size, len(table)))
+        f.write(records)
+        f.write(table)
+        f.flush()
+        metrics.fsync(f.fileno(), 'snapshot')
+        metrics.PERSISTENCE_BYTES.labels('snapshot').inc(f.tell())
+    return tmp_path
+
+
+def _write_temp_snapshot(path, items):
+    tmp_path = _temp_path(path)
+    with open(tmp_path, 'w') as f:
+        # Streams one record at a time; the output is byte-identical to json.dump(indent=4).
+        f.write('[')
+        count = 0
+        for item in items:
+            f.write(',\n    ' if count else '\n    ')
+            f.write(json.dumps(item.as_dict(), indent=4).replace('\n', '\n    '))
+            count += 1
+        f.write('\n]' if count else ']')
+        f.flush()
+        metrics.fsync(f.fileno(), 'snapshot')
+        metrics.PERSISTENCE_BYTES.labels('snapshot').inc(os.fstat(f.fileno()).st_size)
+    return tmp_path
+
+
+def _fsync_dir(path):
+    """Makes a rename inside the directory of `path` durable (no-op where unsupported)."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        metrics.fsync(fd, 'dir')
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class FileLock:
+    """
+    An exclusive lock shared by every thread and every worker process using the
+    same path (flock() on a lock file). Reentrant within a thread.
+
+    keep() makes this process go on holding the flock (though not the lock
+    within the process) once the current holder is done, until a later holder
+    calls release(): other processes then wait while this one has changes
+    buffered.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._rlock = threading.RLock()
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+        self._flocked = False
+        self._kept = False
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._rlock:
+            if self._depth == 0 and fcntl is not None:
+                # Reopen after fork(): a descriptor inherited from the parent would share its lock.
+                if self._fd is None or self._pid != os.getpid():
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    self._pid = os.getpid()
+                    self._flocked = False
+                if not self._flocked:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+                    self._flocked = True
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and self._flocked and not self._kept:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                    self._flocked = False
+
+    def keep(self):
+        """Keeps the flock once the outermost exclusive() block exits (call while holding the lock)."""
+        self._kept = True
+
+    def release(self):
+        """Lets the flock go when the outermost exclusive() block exits (call while holding the lock)."""
+        self._kept = False
+
+
+class VersionFile:
+    """
+    Two counters in a tiny memory-mapped file: how many records have ever been
+    appended to the log, and the log's current generation. Workers compare it
+    with what they have applied to tell, without any I/O, whether another
+    worker has changed the catalog.
+
+    The mapping is never synced, so after a crash (or if the file is lost)
+    the version can go back and number new changes with values already used.
+    Versions are therefore only meaningful within an epoch: every worker
+    holds a shared flock on the file while it runs, and the first to start
+    when none is running picks a new epoch.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._fd = None   # holds the shared "worker running" flock
+
+    def _open(self):
+        size = struct.calcsize(VERSION_FORMAT) + struct.calcsize(EPOCH_FORMAT)
+        with open(self.path, 'a+b') as f:
+            if os.path.getsize(self.path) < size:
+                f.write(b'\0' * (size - os.path.getsize(self.path)))
+                f.flush()
+            self._map = mmap.mmap(f.fileno(), size)
+
+    def read(self):
+        if self._map is None:
+            self._open()
+        return struct.unpack_from(VERSION_FORMAT, self._map)
+
+    def write(self, version, generation):
+        """Publishes new counters; callers hold the log's FileLock."""
+        if self._map is None:
+            self._open()
+        struct.pack_into(VERSION_FORMAT, self._map, 0, version, generation)
+
+    def epoch(self):
+        """Returns the current epoch, first choosing a new one if no other worker is running."""
+        if self._map is None:
+            self._open()
+        offset = struct.calcsize(VERSION_FORMAT)
+        if self._fd is None:
+            # Callers hold the log's FileLock, so no other worker is making this check.
+            self._fd = os.open(self.path, os.O_RDWR)
+            if _first_worker(self._fd):
+                epoch = int.from_bytes(os.urandom(8), 'little') >> 1 or 1
+                struct.pack_into(EPOCH_FORMAT, self._map, offset, epoch)
+        return struct.unpack_from(EPOCH_FORMAT, self._map, offset)[0]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _first_worker(fd):
+    """Takes a shared flock on `fd` for as long as it stays open; True if nobody else held one."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        first = True
+    except BlockingIOError:
+        first = False
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    return first
+
+
+class LogRotatedAway(Exception):
+    """The records a worker still needed were compacted away; it must reload from the snapshot."""
+
+
+class WriteAheadLog:
+    """
+    Records each create/update/delete as one compact JSON line appended to `<snapshot>.log`.
+    Concurrent appenders share fsyncs (group commit), and the log is periodically
+    rotated and folded into an atomically-replaced snapshot on a background thread.
+
+    Several worker processes may share one log. Each holds `lock` while it
+    catches up (read_new()), appends or compacts, and publishes its progress
+    in `<snapshot>.version`, so other workers can cheaply tell (is_current())
+    when they need to read the records appended since.
+
+    With snapshot_format='binary', compaction writes the binary snapshot
+    (library_data.bin) instead of the JSON one, and removes the JSON one.
+    Either snapshot is read on load, so switching formats needs no conversion.
+
+    With durability 'flush' or 'immediate' (see DURABILITY_MODES) appends
+    only buffer their records: a background thread writes everything buffered
+    in one write, publishes it to other workers and fsyncs it, once per
+    flush_interval. Until then this process keeps `lock`'s flock, so other
+    workers cannot append in between (they wait up to one interval).
+    """
+    def __init__(self, snapshot_path, snapshot_source=None, compact_threshold=COMPACT_THRESHOLD,
+                 snapshot_format='json', durability='sync', flush_interval=FLUSH_INTERVAL):
+        if snapshot_format not in ('json', 'binary'):
+            raise ValueError(f"unknown snapshot format: {snapshot_format}")
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"unknown durability: {durability}")
+        self.snapshot_path = snapshot_path
+        self.snapshot_format = snapshot_format
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.log_path = snapshot_path + '.log'
+        # Callable returning the items to write when the log is compacted.
+        self.snapshot_source = snapshot_source
+        self.compact_threshold = compact_threshold
+        self.lock = FileLock(snapshot_path + '.lock')
+        self.versions = VersionFile(snapshot_path + '.version')
+        # Number of records (from any worker) reflected in this process's state.
+        self.version = 0
+        # Versions are only comparable within one epoch (see VersionFile); set by load().
+        self.epoch = 0
+        # The version last published in the version file; behind `version`
+        # only while this process has records buffered.
+        self._published = 0
+
+        self._lock = threading.Lock()       # guards the log file and rotation
+        self._sync_lock = threading.Lock()  # only one fsync leader at a time
+        self._file = None
+        self._appended = 0   # sequence number of the last record written
+        self._synced = 0     # sequence number covered by the last fsync
+        self._records = 0    # records in the current (unrotated) log
+        self._generation = 0
+        self._offset = 0     # bytes of the current log already applied
+        self._compactor = None
+        self._pending = []   # encoded records not yet written (write-behind)
+        self._flushed = threading.Condition(self._sync_lock)  # notified as _synced advances
+        self._flush_error = None
+        self._flusher = None
+        self._closing = threading.Event()
+
+    # --- Recovery ---
+
+    def _snapshot_paths(self):
+        """Both snapshot files, the one in the configured format first."""
+        paths = [self.snapshot_path, binary_snapshot_path(self.snapshot_path)]
+        return paths[::-1] if self.snapshot_format == 'binary' else paths
+
+    def has_data(self):
+        """True if a snapshot or a log exists, i.e. there is a catalog to load."""
+        return any(os.path.exists(path) for path in self._snapshot_paths() + [self.log_path])
+
+    def load(self, make_item):
+        """
+        Returns an id -> item dict built, with make_item(id, type, title, author, year),
+        from the snapshot plus every log, in order. Callers hold `lock`.
+        """
+        items = {}
+        if self._file is not None:
+            # Buffered records belong in the log being read back.
+            with self._lock:
+                self._write_pending()
+        try:
+            # Installing a snapshot removes the other format's, so normally only one
+            # exists; after a crash in between, the configured format's is the newer.
+            snapshot = next((path for path in self._snapshot_paths() if os.path.exists(path)), None)
+            if snapshot is not None:
+                # Built item by item: the parsed document is never held in memory.
+                for item in read_snapshot(snapshot, make_item):
+                    items[item.id] = item
+
+            for path in self._rotated_logs():
+                self._replay(path, items, make_item)
+            self._records = self._replay(self.log_path, items, make_item, truncate_torn_tail=True)
+        finally:
+            # Appends must keep working even if recovery failed part-way.
+            self.epoch = self.versions.epoch()
+            version, generation = self.versions.read()
+            rotated = self._rotated_logs()
+            self._generation = max([generation] + [self._log_generation(p) for p in rotated])
+            self.version = version
+            self._publish()
+            with self._lock:
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self.log_path, 'ab')
+                self._offset = self._file.tell()
+            if self.durability != 'sync' and self._flusher is None:
+                self._closing.clear()
+                self._flusher = threading.Thread(target=self._flush_forever, daemon=True)
+                self._flusher.start()
+        return items
+
+    def _rotated_logs(self):
+        return sorted(glob.glob(glob.escape(self.log_path) + '.*'), key=self._log_generation)
+
+    def _log_generation(self, path):
+        suffix = path.rsplit('.', 1)[-1]
+        return int(suffix) if suffix.isdigit() else -1
+
+    def _replay(self, path, items, make_item, truncate_torn_tail=False):
+        """Applies the records in `path` to `items`; returns the number of records applied."""
+        if not os.path.exists(path):
+            return 0
+        applied = 0
+        valid_length = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                # A crash mid-append leaves at most one partial line at the tail.
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                apply_record(items, record, make_item)
+                applied += 1
+                valid_length += len(line)
+        if truncate_torn_tail and valid_length != os.path.getsize(path):
+            print(f"Discarding torn tail of {path} at byte {valid_length}")
+            with open(path, 'r+b') as f:
+                f.truncate(valid_length)
+        return applied
+
+    # --- Changes from other workers ---
+
+    def is_current(self):
+        """True if no other worker has appended or rotated since this one last caught up."""
+        return self.versions.read() == (self._published, self._generation)
+
+    def _publish(self):
+        # Callers hold `lock`.
+        self.versions.write(self.version, self._generation)
+        self._published = self.version
+
+    def read_new(self):
+        """
+        Returns the records other workers appended since this process last caught
+        up, following a rotation if one happened. Raises LogRotatedAway when they
+        are no longer available. Callers hold `lock`.
+        """
+        version, generation = self.versions.read()
+        records = []
+        if generation != self._generation:
+            if generation != self._generation + 1:
+                raise LogRotatedAway()
+            # Finish the log as it was when it was rotated, then start on the new one.
+            records += self._read_from(f"{self.log_path}.{generation}")
+            with self._lock:
+                self._file.close()
+                self._file = open(self.log_path, 'ab')
+                self._generation = generation
+                self._offset = 0
+                self._records = 0
+        new = self._read_from(self.log_path)
+        records += new
+        self._records += len(new)
+        self.version = self._published = version
+        return records
+
+    def _read_from(self, path):
+        try:
+            with open(path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            raise LogRotatedAway()
+        complete = data[:data.rfind(b'\n') + 1]
+        self._offset += len(complete)
+        return [json.loads(line) for line in complete.splitlines() if line.strip()]
+
+    # --- Appends ---
+
+    def append_create(self, item, sync=True):
+        """Records the creation of `item`; returns the record's sequence number."""
+        return self._append({'op': 'create', 'item': item.as_dict()}, sync=sync)
+
+    def append_update(self, item, sync=True):
+        """Records the new state of an edited `item`; returns the record's sequence number."""
+        return self._append({'op': 'update', 'item': item.as_dict()}, sync=sync)
+
+    def append_delete(self, item_id, sync=True):
+        """Records the deletion of the item with `item_id`; returns the record's sequence number."""
+        return self._append({'op': 'delete', 'id': item_id}, sync=sync)
+
+    def append_creates(self, items, sync=True):
+        """Records a batch of creations with a single write and fsync; returns the last sequence number."""
+        return self._append(*({'op': 'create', 'item': item.as_dict()} for item in items), sync=sync)
+
+    def _append(self, *records, sync=True):
+        """
+        Writes `records` to the log, or buffers them for the background flush.
+        With sync=False the caller must pass the returned sequence number to
+        sync() before treating them as durable; this lets a caller write under
+        its own lock (fixing the record order) and fsync after releasing it.
+        Callers hold `lock` and have caught up.
+        """
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode()
+        with self._lock:
+            self._appended += len(records)
+            self._records += len(records)
+            self._offset += len(data)
+            self.version += len(records)
+            if self.durability == 'sync':
+                if data:
+                    self._file.write(data)
+                    self._file.flush()
+                    metrics.PERSISTENCE_BYTES.labels('log').inc(len(data))
+                self._publish()
+            else:
+                self._pending.append(data)
+                # Nobody else may append before these records are written.
+                self.lock.keep()
+            seq = self._appended
+            should_compact = self._records >= self.compact_threshold
+        if sync:
+            self.sync(seq)
+        if should_compact:
+            self.compact()
+        return seq
+
+    def sync(self, seq):
+        """
+        Blocks until record `seq` is on disk, sharing one fsync among waiting
+        writers; with write-behind, until the flush covering it (or not at all
+        for durability 'immediate').
+        """
+        if self.durability == 'immediate':
+            return
+        if self.durability == 'flush':
+            with self._flushed:
+                while self._synced < seq:
+                    if self._flush_error is not None:
+                        raise self._flush_error
+                    self._flushed.wait()
+            return
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                target = self._appended
+                fd = self._file.fileno()
+            # Appends continue while we sync; rotation waits on _sync_lock.
+            metrics.fsync(fd, 'log')
+            self._synced = target
+
+    # --- Write-behind ---
+
+    def _write_pending(self):
+        # Callers hold _lock (and `lock`).
+        if not self._pending:
+            return
+        data = b''.join(self._pending)
+        self._file.write(data)
+        # The file's buffer holds the records now; a failed flush() is retried by the next one.
+        self._pending = []
+        self._file.flush()
+        metrics.PERSISTENCE_BYTES.labels('log').inc(len(data))
+
+    def flush(self):
+        """
+        Writes every buffered record in one write, publishes them to other
+        workers, lets the flock go and fsyncs; then wakes the appends waiting
+        on them. A no-op for durability 'sync'.
+        """
+        if self.durability == 'sync':
+            return
+        with self._lock:
+            # Nothing buffered, unpublished or unsynced: leave the flock alone.
+            if not self._pending and self._published == self.version and self._synced >= self._appended:
+                return
+        with self.lock.exclusive():
+            try:
+                with self._lock:
+                    self._write_pending()
+                    if self._published != self.version:
+                        self._publish()
+                        metrics.LOG_FLUSHES.inc()
+                    target = self._appended
+                    fd = self._file.fileno()
+            finally:
+                self.lock.release()
+        with self._flushed:
+            if self._synced < target:
+                metrics.fsync(fd, 'log')
+                self._synced = target
+            self._flush_error = None
+            self._flushed.notify_all()
+
+    def _flush_forever(self):
+        # Ticks at a fixed rate: the time spent flushing counts towards the interval.
+        deadline = time.monotonic()
+        while True:
+            deadline = max(deadline + self.flush_interval, time.monotonic())
+            if self._closing.wait(deadline - time.monotonic()):
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"CRITICAL ERROR: Failed to flush JSON log: {e}")
+                with self._flushed:
+                    self._flush_error = e
+                    self._flushed.notify_all()
+
+    # --- Compaction ---
+
+    def compact(self, background=True):
+        """
+        Rotates the current log and folds it into a fresh snapshot. Callers hold
+        `lock` and have caught up, so snapshot_source() reflects every record.
+        """
+        if background and self._compactor is not None and self._compactor.is_alive():
+            return
+        with self._sync_lock, self._lock:
+            if background and self._records < self.compact_threshold:
+                # Another writer already rotated this log.
+                return
+            items = list(self.snapshot_source()) if self.snapshot_source else []
+            self._generation += 1
+            generation = self._generation
+            # The rotated log must hold every record, buffered ones included.
+            self._write_pending()
+            self._file.flush()
+            metrics.fsync(self._file.fileno(), 'log')
+            self._synced = self._appended
+            self._flushed.notify_all()
+            self._file.close()
+            os.replace(self.log_path, f"{self.log_path}.{generation}")
+            self._file = open(self.log_path, 'ab')
+            self._records = 0
+            self._offset = 0
+            self._publish()
+
+        if background:
+            self._compactor = threading.Thread(target=self._write_snapshot, args=(items, generation), daemon=True)
+            self._compactor.start()
+        else:
+            self._write_snapshot(items, generation)
+
+    def _write_snapshot(self, items, generation):
+        try:
+            target, other = self._snapshot_paths()
+            if self.snapshot_format == 'binary':
+                tmp_path = _write_temp_binary_snapshot(target, items)
+            else:
+                tmp_path = _write_temp_snapshot(target, items)
+            with self.lock.exclusive():
+                if not os.path.exists(f"{self.log_path}.{generation}"):
+                    # A later compaction (maybe in another worker) already covered this log.
+                    os.remove(tmp_path)
+                    return
+                os.replace(tmp_path, target)
+                if os.path.exists(other):
+                    os.remove(other)
+                _fsync_dir(target)
+                # Logs up to this generation are now reflected in the snapshot.
+                for path in self._rotated_logs():
+                    if self._log_generation(path) <= generation:
+                        os.remove(path)
+        except Exception as e:
+            print(f"CRITICAL ERROR: Failed to compact JSON log: {e}")
+
+    def close(self):
+        """Flushes buffered records, waits for any running compaction and closes the log file."""
+        if self._flusher is not None:
+            self._closing.set()
+            self._flusher.join()
+            self._flusher = None
+        if self._file is not None:
+            self.flush()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                metrics.fsync(self._file.fileno(), 'log')
+                self._file.close()
+                self._file = None
+        self.versions.close()
+
+
+def apply_record(items, record, make_item):
+    """Applies one log record to an id -> item dict mapping."""
+    if record.get('op') in ('create', 'update'):
+        item_data = record['item']
+        if record['op'] == 'create':
+            items.pop(item_data.get('id'), None)
+        items[item_data.get('id')] = make_item(*(item_data.get(field) for field in ITEM_FIELDS))
+    elif record.get('op') == 'delete':
+        items.pop(record.get('id'), None)